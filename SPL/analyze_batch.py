@@ -1,8 +1,13 @@
 import os
+import fnmatch
 import glob
 import re
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')  # Set a non-interactive backend BEFORE anything imports pyplot
+from matplotlib.figure import Figure
 from fringes_matching import main as fringes_matching_main
 import argparse
 from pathlib import Path
@@ -14,16 +19,46 @@ def extract_tt_number(folder_path):
         return int(match.group(1))
     return None
 
+def find_tt_folders(base_dir, pattern, target_filename):
+    """
+    Find the TT folders matching pattern and whether each one contains target_filename.
+    Every directory is listed once with os.scandir instead of stat-ing each expected file.
+    """
+    if os.sep in pattern or (os.altsep and os.altsep in pattern):
+        # A pattern spanning several directory levels needs glob itself
+        tt_folders = sorted(path for path in glob.glob(os.path.join(base_dir, pattern)) if os.path.isdir(path))
+    else:
+        # Same matches as glob: hidden names only for patterns starting with '.'
+        match_hidden = pattern.startswith('.')
+        # A missing base_dir simply yields no folders, as glob did
+        try:
+            with os.scandir(base_dir) as entries:
+                tt_folders = sorted(entry.path for entry in entries
+                                    if entry.is_dir() and (match_hidden or not entry.name.startswith('.'))
+                                    and fnmatch.fnmatch(entry.name, pattern))
+        except (FileNotFoundError, NotADirectoryError):
+            return [], []
+    
+    def has_target(tt_folder):
+        # The folder may have disappeared since it was listed
+        try:
+            with os.scandir(tt_folder) as entries:
+                return any(entry.name == target_filename and entry.is_file() for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+    
+    # Listing the folders is I/O bound (slow on network drives), overlap it across threads
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as executor:
+        found = list(executor.map(has_target, tt_folders))
+    return tt_folders, found
+
 def process_tt_folder(tt_folder, pos_id, pattern="*.fits"):
-    """Process a single TT folder and return the TT number and piston value."""
+    """Process a single TT folder and return the TT number and piston value.
+    The folder is expected to contain the target file (see find_tt_folders)."""
     # Construct the specific filename for this position
     target_filename = f'fringe_result_pos{pos_id}.fits'
     target_file = os.path.join(tt_folder, target_filename)
     
-    if not os.path.exists(target_file):
-        print(f"Target file not found: {target_file}")
-        return None, None
-    
     # Create a temporary argument parser to pass the target file to fringes_matching
     class Args:
         def __init__(self, target_fits_path):
@@ -48,20 +83,27 @@ def process_tt_folder(tt_folder, pos_id, pattern="*.fits"):
         print(f"Error processing {tt_folder}: {e}")
         return None, None
 
+def _worker(job):
+    """Pool entry point: process one (tt_folder, pos_id) job."""
+    tt_folder, pos_id = job
+    print(f"\nProcessing folder: {tt_folder}")
+    return process_tt_folder(tt_folder, pos_id)
+
 def plot_piston_values(tt_numbers, piston_values, output_dir, pos_id):
-    """Plot differential piston values as a function of TT number."""
-    plt.figure(figsize=(12, 6))
-    plt.plot(tt_numbers, piston_values, 'bo-', label='Differential Piston')
-    plt.xlabel('TT Number')
-    plt.ylabel('Differential Piston (nm)')
-    plt.title(f'Differential Piston Values vs TT Number (Position {pos_id})')
-    plt.grid(True)
-    plt.legend()
+    """Plot differential piston values as a function of TT number.
+    A standalone Figure is used instead of pyplot, so it can be rendered from a worker thread."""
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.plot(tt_numbers, piston_values, 'bo-', label='Differential Piston')
+    ax.set_xlabel('TT Number')
+    ax.set_ylabel('Differential Piston (nm)')
+    ax.set_title(f'Differential Piston Values vs TT Number (Position {pos_id})')
+    ax.grid(True)
+    ax.legend()
     
     # Save the plot
     output_path = os.path.join(output_dir, f'piston_values_pos{pos_id}_plot.png')
-    plt.savefig(output_path)
-    plt.close()
+    fig.savefig(output_path)
     print(f"Plot saved to {output_path}")
 
 def main():
@@ -69,25 +111,34 @@ def main():
     parser.add_argument("base_dir", help="Base directory containing TT folders")
     parser.add_argument("--pattern", default="20250508_*", help="Pattern to match TT folders")
     parser.add_argument("--pos-id", required=True, help="Position ID to process (e.g., '001' for fringe_result_001.fits)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
     args = parser.parse_args()
     
-    # Find all matching TT folders
-    tt_folders = glob.glob(os.path.join(args.base_dir, args.pattern))
+    # Find all matching TT folders, keeping only those containing the target file
+    target_filename = f'fringe_result_pos{args.pos_id}.fits'
+    tt_folders, found = find_tt_folders(args.base_dir, args.pattern, target_filename)
     if not tt_folders:
         print(f"No folders found matching pattern {args.pattern} in {args.base_dir}")
         return
+    for tt_folder, has_target in zip(tt_folders, found):
+        if not has_target:
+            print(f"Target file not found: {os.path.join(tt_folder, target_filename)}")
     
-    # Process each TT folder
-    tt_numbers = []
-    piston_values = []
+    # Process the TT folders in parallel, one independent job per folder
+    jobs = [(tt_folder, args.pos_id) for tt_folder, has_target in zip(tt_folders, found) if has_target]
+    workers = args.workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    results = []
+    with mp.Pool(processes=workers) as pool:
+        for tt_number, piston_value in pool.imap_unordered(_worker, jobs, chunksize=chunksize):
+            if tt_number is not None and piston_value is not None:
+                results.append((tt_number, piston_value))
+                print(f"TT {tt_number}: Piston value = {piston_value:.2f} nm")
     
-    for tt_folder in sorted(tt_folders):
-        print(f"\nProcessing folder: {tt_folder}")
-        tt_number, piston_value = process_tt_folder(tt_folder, args.pos_id)
-        if tt_number is not None and piston_value is not None:
-            tt_numbers.append(tt_number)
-            piston_values.append(piston_value)
-            print(f"TT {tt_number}: Piston value = {piston_value:.2f} nm")
+    # Results arrive in completion order, restore TT order for plotting
+    results.sort(key=lambda result: result[0])
+    tt_numbers = [tt for tt, _ in results]
+    piston_values = [piston for _, piston in results]
     
     # Create output directory if it doesn't exist
     output_dir = os.path.join(args.base_dir, "analysis_results")
@@ -95,15 +146,18 @@ def main():
     
     # Plot the results
     if tt_numbers and piston_values:
-        plot_piston_values(tt_numbers, piston_values, output_dir, args.pos_id)
-        
-        # Save the data to a text file
-        data_path = os.path.join(output_dir, f'piston_values_pos{args.pos_id}.txt')
-        with open(data_path, 'w') as f:
-            f.write("TT_Number,Piston_Value(nm)\n")
-            for tt, piston in zip(tt_numbers, piston_values):
-                f.write(f"{tt},{piston:.2f}\n")
-        print(f"Data saved to {data_path}")
+        # Render the PNG in the background while the data file is written
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            plot_future = executor.submit(plot_piston_values, tt_numbers, piston_values, output_dir, args.pos_id)
+            
+            # Save the data to a text file
+            data_path = os.path.join(output_dir, f'piston_values_pos{args.pos_id}.txt')
+            with open(data_path, 'w') as f:
+                f.write("TT_Number,Piston_Value(nm)\n")
+                for tt, piston in zip(tt_numbers, piston_values):
+                    f.write(f"{tt},{piston:.2f}\n")
+            print(f"Data saved to {data_path}")
+            plot_future.result()
     else:
         print("No valid data to plot")
 
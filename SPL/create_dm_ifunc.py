@@ -3,23 +3,40 @@ from astropy.io import fits
 import matplotlib.pyplot as plt
 import os
 import sys
+from fits_io import writeto
 
 class createDmInfluenceFunction:
     def __init__(self, size=3200, filename='step_response_output.fits'):
         self.size = size
         self.filename = os.path.join(".\\calib\\data", filename)
         self._influence_function = self.generate_step_response()
-        self._mask_inf_func = np.ones((size, size))  # Mask filled with ones
+        self._mask_inf_func = np.broadcast_to(np.ones(size, dtype=np.float32), (size, size))  # Mask filled with ones (read-only view)
 
     def generate_step_response(self):
-        # Create an array where the left side is 0 and the right side is 1
-        step_response = np.zeros((self.size, self.size))
-        step_response[:, self.size // 2:] = 1  # Set right half to 1
-        return step_response
-
-    def save_step_response(self):
-        # Flatten the 2D influence function into a 1D array
-        flattened_influence_function = self._influence_function.flatten()
+        # Create a row where the left side is 0 and the right side is 1
+        step_row = np.zeros(self.size, dtype=np.float32)  # Saved as 32-bit floats (BITPIX = -32)
+        step_row[self.size // 2:] = 1  # Set right half to 1
+        # All rows are identical: broadcast the row to 2D as a read-only view instead of allocating size*size
+        return np.broadcast_to(step_row, (self.size, self.size))
+
+    def _is_saved(self, path, shape):
+        # True if path holds data of this shape (extension 1) written after the last change of this script:
+        # the files depend only on the size, so they can be reused instead of being written again
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(__file__):
+                return False
+            header = fits.getheader(path, ext=1)
+        except (OSError, IndexError, KeyError):
+            return False
+        return (header.get('NAXIS2'), header.get('NAXIS1')) == shape
+
+    def save_step_response(self, skip_existing=False):
+        # Reuse the file of a previous run for the same size
+        if skip_existing and self._is_saved(self.filename, (1, self.size * self.size)):
+            return os.path.abspath(self.filename)
+
+        # Flatten the 2D influence function into a 1D array (materialized only here, for writing)
+        flattened_influence_function = np.ascontiguousarray(self._influence_function).reshape(-1)
 
         # Calculate NAXIS1 dynamically as size * size
         naxis1 = self.size * self.size
@@ -47,12 +64,19 @@ class createDmInfluenceFunction:
             os.makedirs(dir_path, exist_ok=True)
         
         # Save the file and return the full path
-        hdul.writeto(self.filename, overwrite=True)
+        writeto(hdul, self.filename)
         return os.path.abspath(self.filename)
 
-    def save_mask_piston(self):
-        # Create a 2D array filled with ones (mask)
-        mask_piston = np.ones((self.size, self.size))
+    def save_mask_piston(self, skip_existing=False):
+        # Generate the filename for the mask piston FITS file
+        mask_filename = os.path.join(os.path.dirname(self.filename), f'mask_piston_{self.size}.fits')
+
+        # Reuse the file of a previous run for the same size
+        if skip_existing and self._is_saved(mask_filename, (self.size, self.size)):
+            return os.path.abspath(mask_filename)
+
+        # Create a 2D array filled with ones (mask), as a read-only view of a single row
+        mask_piston = np.broadcast_to(np.ones(self.size, dtype=np.float32), (self.size, self.size))
 
         # Create the FITS header with required fields
         hdr = fits.Header()
@@ -75,11 +99,8 @@ class createDmInfluenceFunction:
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
         
-        # Generate the filename for the mask piston FITS file
-        mask_filename = os.path.join(os.path.dirname(self.filename), f'mask_piston_{self.size}.fits')
-        
         # Save the file and return the full path
-        hdul.writeto(mask_filename, overwrite=True)
+        writeto(hdul, mask_filename)
         return os.path.abspath(mask_filename)
 
     def display_step_response(self):
@@ -1,10 +1,217 @@
 import numpy as np
-import glob
+import re
 import astropy.io.fits as fits
 import os
 import argparse
-import matplotlib.pyplot as plt
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
+from fits_io import io_threads
+
+try:
+    import fitsio  # Optional: faster CFITSIO-based reads and writes
+except ImportError:
+    fitsio = None
+
+try:
+    import numba  # Optional: compiled row sums and normalization
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _sum_rows_kernel(cube_rows, idx_map, out):
+        # One pass over the central rows of every selected plane, planes split across cores
+        for k in numba.prange(idx_map.shape[0]):
+            plane = cube_rows[idx_map[k]]
+            for x in range(plane.shape[1]):
+                acc = 0.0
+                for r in range(plane.shape[0]):
+                    acc += plane[r, x]
+                out[k, x] = acc
+
+    @numba.njit(cache=True)
+    def _normalize_kernel(data, out):
+        # Min and max in a single pass, then one scaling pass; returns False for flat data
+        lo = data[0, 0]
+        hi = data[0, 0]
+        for i in range(data.shape[0]):
+            for j in range(data.shape[1]):
+                v = data[i, j]
+                if v < lo:
+                    lo = v
+                if v > hi:
+                    hi = v
+        if not hi > lo:
+            return False
+        scale = 1.0 / (hi - lo)
+        for i in range(data.shape[0]):
+            for j in range(data.shape[1]):
+                out[i, j] = (data[i, j] - lo) * scale
+        return True
+
+
+# PSF file names: psf<wavelength>.fits, or psf<wavelength>_crop.fits for cropped cubes
+_PSF_FILE_RE = re.compile(r'psf(\d+)(_crop)?\.fits')
+# Cropped cubes of a folder written by specula_psf_to_spl_cube.py, one extension per wavelength (WAVELEN keyword)
+_CROPS_FILE = "crops.fits"
+
+
+@functools.lru_cache(maxsize=None)
+def _discover_files(parent_folder):
+    """
+    Finds the PSF FITS files in the timestamped subdirectories of the parent folder.
+    The result is cached so that the folders are scanned only once per run.
+
+    Parameters:
+    parent_folder (str): Path to the parent folder containing timestamped subdirectories.
+
+    Returns:
+    tuple: (wavelength, filepath, extension) triples, in folder and filename order, one cube per wavelength.
+    """
+    if not os.path.isdir(parent_folder):
+        print("No timestamped folders found!")
+        return ()
+    with os.scandir(parent_folder) as entries:
+        timestamped_folders = sorted(entry.path for entry in entries
+                                     if entry.is_dir() and entry.name.startswith("2025"))  # Modify pattern if needed
+    if not timestamped_folders:
+        print("No timestamped folders found!")
+        return ()
+
+    discovered_files = []
+    wavelengths_seen = set()
+    for folder in timestamped_folders:
+        # List the folder once, parsing the wavelength of every PSF file from its name
+        crop_files, standard_files = [], []
+        crops_file = None
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                name = os.path.normcase(entry.name)  # normcase: case-insensitive on Windows, as glob
+                if name == _CROPS_FILE and entry.is_file():
+                    crops_file = entry.path
+                    continue
+                match = _PSF_FILE_RE.fullmatch(name)
+                if match and entry.is_file():
+                    files = crop_files if match.group(2) else standard_files
+                    files.append((entry.name, int(match.group(1)), entry.path, 0))
+
+        # Use the crops.fits extensions or the _crop.fits files if any, otherwise fall back to standard .fits files
+        if crops_file is not None:
+            fits_files = [(_CROPS_FILE, wavelength, crops_file, ext) for ext, wavelength in _read_wavelength_extensions(crops_file)]
+        else:
+            fits_files = sorted(crop_files or standard_files)
+
+        if not fits_files:
+            print(f"No FITS files found in {folder}")
+            continue  # Skip if no FITS files found
+
+        for _, wavelength, file, ext in fits_files:
+            # Keep the first file of every wavelength
+            if wavelength in wavelengths_seen:
+                print(f"Warning: Wavelength {wavelength} nm already found, skipping {file}" + (f"[{ext}]" if ext else ""))
+                continue
+            wavelengths_seen.add(wavelength)
+            discovered_files.append((wavelength, file, ext))
+
+    return tuple(discovered_files)
+
+
+def _make_header(cards=()):
+    """
+    Builds a header for _write_fits from (keyword, value, comment) tuples.
+    Building it once and reusing it avoids converting the same cards for every file.
+    """
+    if fitsio is not None:
+        return [{'name': keyword, 'value': value, 'comment': comment} for keyword, value, comment in cards]
+    return fits.Header(list(cards))
+
+
+def _write_fits(filename, data, cards=(), header=None, table=None, table_name=None):
+    """
+    Writes data to a new FITS file, overwriting any existing one.
+
+    Parameters:
+    filename (str): Output FITS file path.
+    data (numpy.ndarray): Image data for the primary HDU.
+    cards (sequence): (keyword, value, comment) tuples to add to the header.
+    header (optional): Header template from _make_header, copied and completed with cards.
+    table (numpy.ndarray, optional): Structured array written as a binary table extension.
+    table_name (str, optional): EXTNAME of the binary table extension.
+    """
+    if fitsio is not None:
+        header = (header or []) + _make_header(cards)
+        with fitsio.FITS(filename, 'rw', clobber=True) as f:
+            f.write(np.ascontiguousarray(data), header=header)
+            if table is not None:
+                f.write(table, extname=table_name)
+    else:
+        header = header.copy() if header is not None else fits.Header()
+        for keyword, value, comment in cards:
+            header.append((keyword, value, comment))
+        if table is None:
+            fits.writeto(filename, data, header=header, overwrite=True)
+        else:
+            fits.HDUList([fits.PrimaryHDU(data, header=header),
+                          fits.BinTableHDU(table, name=table_name)]).writeto(filename, overwrite=True)
+
+
+def _read_header(filename, ext=0):
+    """
+    Reads the header of an HDU of a FITS file (primary by default), without reading its data.
+    """
+    if fitsio is not None:
+        return fitsio.read_header(filename, ext=ext)
+    return fits.getheader(filename, ext=ext)
+
+
+def _read_wavelength_extensions(filename):
+    """
+    Lists the (extension, wavelength) pairs of the HDUs with a WAVELEN keyword, reading only the headers.
+    """
+    if fitsio is not None:
+        with fitsio.FITS(filename) as f:
+            headers = [hdu.read_header() for hdu in f]
+    else:
+        with fits.open(filename) as hdul:
+            headers = [hdu.header for hdu in hdul]
+    return [(ext, int(header['WAVELEN'])) for ext, header in enumerate(headers) if 'WAVELEN' in header]
+
+
+def _read_data(filename):
+    """
+    Reads the primary data of a FITS file, or None if the primary HDU is empty.
+    """
+    if fitsio is not None:
+        with fitsio.FITS(filename) as f:
+            return f[0].read() if f[0].has_data() else None
+    with fits.open(filename) as hdul:
+        return hdul[0].data
+
+
+@functools.lru_cache(maxsize=1)
+def _fringe_header(cards):
+    """
+    Returns the header template shared by all the Fringe files, built once per process.
+    """
+    return _make_header(cards)
+
+
+def _write_fringe(job):
+    """
+    Writes one Fringe file. Defined at module level so that it can run in worker processes.
+
+    Parameters:
+    job (tuple): (filename, data, piston_value, cards) where cards is the tuple of header cards shared by all the fringes.
+
+    Returns:
+    str: The written filename.
+    """
+    filename, data, piston_value, cards = job
+    _write_fits(filename, data, [('PSTVAL', piston_value, "Piston value (nm)")], _fringe_header(cards))
+    return filename
+
 
 def get_piston_values_from_fits(parent_folder):
     """
@@ -21,161 +228,304 @@ def get_piston_values_from_fits(parent_folder):
     piston_file = os.path.join(parent_folder, "Differential_piston.fits")
     if os.path.exists(piston_file):
         try:
-            with fits.open(piston_file) as hdul:
-                piston_values = hdul[0].data
-                if piston_values is not None:
-                    print(f"Found piston values in {piston_file}")
-                    return piston_values
+            piston_values = _read_data(piston_file)
+            if piston_values is not None:
+                print(f"Found piston values in {piston_file}")
+                return piston_values
         except Exception as e:
             print(f"Warning: Could not read piston values from {piston_file}: {e}")
 
     # Try to read from first available FITS file header
-    timestamped_folders = sorted(glob.glob(os.path.join(parent_folder, "2025*")))
-    for folder in timestamped_folders:
-        # Try _crop.fits first, then standard .fits
-        fits_files = sorted(glob.glob(os.path.join(folder, "psf*_crop.fits")))
-        if not fits_files:
-            fits_files = sorted(glob.glob(os.path.join(folder, "psf*.fits")))
-            fits_files = [f for f in fits_files if "_crop.fits" not in f]
-        
-        if fits_files:
-            try:
-                with fits.open(fits_files[0]) as hdul:
-                    header = hdul[0].header
-                    # Check for piston-related keywords
-                    if 'PSTMIN' in header and 'PSTMAX' in header:
-                        pst_min = header['PSTMIN']
-                        pst_max = header['PSTMAX']
-                        pst_step = header.get('PSTSTP', 5)  # Default step of 5
-                        cube_data = hdul[0].data
-                        if cube_data is not None:
-                            piston_axis_size = cube_data.shape[0]
-                            piston_values = np.linspace(pst_min, pst_max, piston_axis_size)
-                            print(f"Found piston values from FITS header: {pst_min} to {pst_max} (step: {pst_step})")
-                            return piston_values
-            except Exception as e:
-                print(f"Warning: Could not read piston values from FITS header: {e}")
-            break  # Only check first folder
+    discovered_files = _discover_files(parent_folder)
+    if discovered_files:
+        try:
+            header = _read_header(discovered_files[0][1], discovered_files[0][2])
+            # Check for piston-related keywords
+            if 'PSTMIN' in header and 'PSTMAX' in header:
+                pst_min = header['PSTMIN']
+                pst_max = header['PSTMAX']
+                pst_step = header.get('PSTSTP', 5)  # Default step of 5
+                # The shape comes from the header, the cube itself is never loaded
+                naxis = header.get('NAXIS', 0)
+                if naxis:
+                    piston_axis_size = header[f'NAXIS{naxis}']  # FITS axes are reversed, the last one is the first numpy axis
+                    piston_values = np.linspace(pst_min, pst_max, piston_axis_size)
+                    print(f"Found piston values from FITS header: {pst_min} to {pst_max} (step: {pst_step})")
+                    return piston_values
+        except Exception as e:
+            print(f"Warning: Could not read piston values from FITS header: {e}")
     
     return None
 
 
-def extract_central_row_at_piston(parent_folder, piston_value=-6000, num_rows_to_accumulate=1, piston_values=None):
+def _file_piston_axis(header, piston_axis_size, piston_values=None):
     """
-    Extracts and sums central rows from FITS files at a specified piston value.
+    Returns the piston values sampled along the first axis of a PSF cube.
 
     Parameters:
-    parent_folder (str): Path to the parent folder containing timestamped subdirectories.
-    piston_value (float): Desired piston value.
-    num_rows_to_accumulate (int): Number of central rows to sum.
-    piston_values (numpy.ndarray, optional): Array of piston values. If None, will be inferred from data.
+    header: FITS header of the cube, used when piston_values is None.
+    piston_axis_size (int): Length of the piston axis of the cube.
+    piston_values (numpy.ndarray, optional): Piston values of the simulation, used if they match the cube size.
 
     Returns:
-    tuple: (wavelengths, extracted_data) where extracted_data is 2D (y = wavelengths, x = pixels).
+    numpy.ndarray: Piston value of each plane of the cube.
     """
-    timestamped_folders = sorted(glob.glob(os.path.join(parent_folder, "2025*")))  # Modify pattern if needed
-    if not timestamped_folders:
-        print("No timestamped folders found!")
-        return None, None
+    if piston_values is not None:
+        # Use provided piston values, but ensure they match the data size
+        if len(piston_values) == piston_axis_size:
+            return np.asarray(piston_values)
+        print(f"Warning: Piston values length ({len(piston_values)}) doesn't match data size ({piston_axis_size}). Inferring from data.")
+        return np.linspace(-6000, 6000, piston_axis_size)
 
-    wavelengths = []
-    extracted_data = []
-    inferred_piston_values = None
+    # Infer piston values from data, trying the header first
+    if 'PSTMIN' in header and 'PSTMAX' in header:
+        return np.linspace(header['PSTMIN'], header['PSTMAX'], piston_axis_size)
+    # Default: assume -6000 to +6000
+    return np.linspace(-6000, 6000, piston_axis_size)
 
-    for folder in timestamped_folders:
-        # First try to find _crop.fits files
-        fits_files = sorted(glob.glob(os.path.join(folder, "psf*_crop.fits")))
-        use_crop = True
-        
-        # If no _crop.fits files found, fall back to standard .fits files
-        if not fits_files:
-            fits_files = sorted(glob.glob(os.path.join(folder, "psf*.fits")))
-            use_crop = False
-            # Filter out any _crop.fits files that might have been found
-            fits_files = [f for f in fits_files if "_crop.fits" not in f]
-        
-        if not fits_files:
-            print(f"No FITS files found in {folder}")
-            continue  # Skip if no FITS files found
 
-        for file in fits_files:
-            filename = os.path.basename(file)
-            # Extract wavelength based on file type
-            if use_crop:
-                wavelength = int(filename.replace("psf", "").replace("_crop.fits", ""))
-            else:
-                wavelength = int(filename.replace("psf", "").replace(".fits", ""))
+def _central_row_bounds(n_rows, num_rows_to_accumulate, wavelength):
+    """
+    Returns the (start_row, end_row) range of the central rows to accumulate.
+    """
+    center_y = n_rows // 2
+    start_row = center_y - num_rows_to_accumulate // 2
+    end_row = start_row + num_rows_to_accumulate
+    # Ensure row indices are within bounds
+    start_row = max(0, start_row)
+    end_row = min(n_rows, end_row)
 
-            if wavelength not in wavelengths:
-                wavelengths.append(wavelength)
+    if start_row >= end_row: # case where num_rows_to_accumulate might be 0 or invalid
+        print(f"Warning: No rows to accumulate for Wavelength {wavelength} with num_rows_to_accumulate={num_rows_to_accumulate}. Using central row.")
+        return center_y, center_y + 1
+    return start_row, end_row
 
-            with fits.open(file) as hdul:
-                cube_data = hdul[0].data  # Assuming data is in primary HDU
-                piston_axis_size = cube_data.shape[0]
 
-                # Use provided piston_values or infer from data
-                if piston_values is not None:
-                    # Use provided piston values, but ensure they match the data size
-                    if len(piston_values) == piston_axis_size:
-                        file_piston_values = piston_values
-                    else:
-                        print(f"Warning: Piston values length ({len(piston_values)}) doesn't match data size ({piston_axis_size}). Inferring from data.")
-                        file_piston_values = np.linspace(-6000, 6000, piston_axis_size)
-                else:
-                    # Infer piston values from data (default behavior)
-                    if inferred_piston_values is None:
-                        # Try to read from header first
-                        header = hdul[0].header
-                        if 'PSTMIN' in header and 'PSTMAX' in header:
-                            pst_min = header['PSTMIN']
-                            pst_max = header['PSTMAX']
-                            inferred_piston_values = np.linspace(pst_min, pst_max, piston_axis_size)
-                        else:
-                            # Default: assume -6000 to +6000
-                            inferred_piston_values = np.linspace(-6000, 6000, piston_axis_size)
-                    file_piston_values = inferred_piston_values
-
-                # Find the closest piston value index
-                piston_idx = np.argmin(np.abs(file_piston_values - piston_value))
-                image = cube_data[piston_idx]  # Select the image at the closest piston value
-                #plt.imshow(image)
-                #plt.show()
-                
-                center_y = image.shape[0] // 2
-                start_row = center_y - num_rows_to_accumulate // 2
-                end_row = start_row + num_rows_to_accumulate
-                # Ensure row indices are within bounds
-                start_row = max(0, start_row)
-                end_row = min(image.shape[0], end_row)
-
-                if start_row >= end_row: # case where num_rows_to_accumulate might be 0 or invalid
-                    print(f"Warning: No rows to accumulate for Wavelength {wavelength} with num_rows_to_accumulate={num_rows_to_accumulate}. Using central row.")
-                    central_profile = image[center_y, :]
-                else:
-                    central_profile = np.sum(image[start_row:end_row, :], axis=0)
-                
-                #plt.plot(central_profile)
-                #plt.show()
-                extracted_data.append(central_profile)
+def _read_central_rows(file, num_rows_to_accumulate, wavelength, ext=0):
+    """
+    Reads only the central rows of every plane of a PSF cube, stored in the HDU ext of the file.
+
+    Returns:
+    tuple: (cube_rows, header) where cube_rows has shape (piston, rows, pixel).
+    """
+    if fitsio is not None:
+        # CFITSIO reads the requested rows straight from disk
+        with fitsio.FITS(file) as f:
+            hdu = f[ext]
+            start_row, end_row = _central_row_bounds(hdu.get_dims()[1], num_rows_to_accumulate, wavelength)
+            return hdu[:, start_row:end_row, :], hdu.read_header()
+
+    with fits.open(file, memmap=True, lazy_load_hdus=True) as hdul:
+        # section reads only the requested rows, the full cube is never mapped into an array
+        start_row, end_row = _central_row_bounds(hdul[ext].shape[1], num_rows_to_accumulate, wavelength)
+        return hdul[ext].section[:, start_row:end_row, :], hdul[ext].header
+
+
+def _load_file_rows(args_tuple):
+    """
+    Loads the central rows of one PSF cube for _extract_file_profiles.
+
+    Parameters:
+    args_tuple (tuple): (file, ext, wavelength, target_piston_values, num_rows_to_accumulate, piston_values, index_table).
+
+    Returns:
+    tuple: (cube_rows, header) as returned by _read_central_rows.
+    """
+    file, ext, wavelength, _, num_rows_to_accumulate, _, _ = args_tuple
+    return _read_central_rows(file, num_rows_to_accumulate, wavelength, ext)
+
+
+def _nearest_piston_indices(file_piston_values, target_piston_values):
+    """
+    Returns the index of the closest value in file_piston_values for every target piston value.
+    Ties go to the lower index, as with np.argmin.
+    """
+    if len(file_piston_values) < 2 or np.any(np.diff(file_piston_values) < 0):
+        # Not sorted, fall back to a full scan
+        return np.argmin(np.abs(file_piston_values[:, None] - target_piston_values[None, :]), axis=0)
+
+    # Binary search for the right neighbour, then step back when the left one is at least as close
+    right = np.clip(np.searchsorted(file_piston_values, target_piston_values), 1, len(file_piston_values) - 1)
+    left = np.searchsorted(file_piston_values, file_piston_values[right - 1])  # First of any repeated values
+    closer_left = np.abs(target_piston_values - file_piston_values[left]) <= np.abs(file_piston_values[right] - target_piston_values)
+    return np.where(closer_left, left, right)
+
+
+def _piston_index_table(file, target_piston_values, piston_values=None, ext=0):
+    """
+    Precomputes the cube plane of every target piston value from the header of one PSF cube
+    (HDU ext of the file), so that it is computed once and not for every file.
+
+    Returns:
+    tuple: (piston_axis_size, idx_map) valid for all the cubes with the same piston axis size.
+    """
+    header = _read_header(file, ext)
+    piston_axis_size = header['NAXIS3']  # FITS axes are reversed: (NAXIS3, NAXIS2, NAXIS1) = (piston, y, x)
+    file_piston_values = _file_piston_axis(header, piston_axis_size, piston_values)
+    return piston_axis_size, _nearest_piston_indices(file_piston_values, target_piston_values)
+
+
+def _reduce_file_rows(cube_rows, header, args_tuple):
+    """
+    Sums the central rows of one PSF cube at every target piston value.
+
+    Returns:
+    numpy.ndarray: Central profiles with shape (len(target_piston_values), image width).
+    """
+    _, _, _, target_piston_values, _, piston_values, index_table = args_tuple
+    piston_axis_size, idx_map = index_table
+    if cube_rows.shape[0] != piston_axis_size:
+        # This cube samples the piston values differently, map them for this file only
+        file_piston_values = _file_piston_axis(header, cube_rows.shape[0], piston_values)
+        idx_map = _nearest_piston_indices(file_piston_values, target_piston_values)
+    if numba is not None and np.issubdtype(cube_rows.dtype, np.floating):
+        # The compiled kernel needs native byte order (FITS data is big-endian)
+        cube_rows = np.ascontiguousarray(cube_rows, cube_rows.dtype.newbyteorder('='))
+        profiles = np.empty((len(idx_map), cube_rows.shape[2]), dtype=cube_rows.dtype)
+        _sum_rows_kernel(cube_rows, idx_map, profiles)
+        return profiles
+    return cube_rows[idx_map].sum(axis=1)
+
+
+def _normalize(data):
+    """
+    Normalizes a 2D floating point array to the 0-1 range, in place when possible.
+    Flat data is returned unchanged.
+
+    Returns:
+    numpy.ndarray: The normalized array, data itself unless a native-order copy was needed.
+    """
+    if numba is not None and np.issubdtype(data.dtype, np.floating):
+        data = np.ascontiguousarray(data, data.dtype.newbyteorder('='))
+        _normalize_kernel(data, data)  # Reads min and max before writing, so data can be its own output
+        return data
+
+    min_val = data.min()
+    max_val = data.max()
+    if max_val > min_val: # Avoid division by zero if data is flat
+        # In place in the float32 buffer: no temporaries, two passes over the data instead of four,
+        # and a multiplication by the reciprocal instead of a division per pixel
+        data -= min_val
+        data *= 1.0 / (max_val - min_val)
+    return data
+
+
+def _extract_file_profiles(args_tuple):
+    """
+    Worker for extract_central_rows: reads one PSF cube once and sums its central rows
+    at every target piston value.
+
+    Parameters:
+    args_tuple (tuple): (file, ext, wavelength, target_piston_values, num_rows_to_accumulate, piston_values, index_table).
+
+    Returns:
+    numpy.ndarray: Central profiles with shape (len(target_piston_values), image width).
+    """
+    cube_rows, header = _load_file_rows(args_tuple)
+    return _reduce_file_rows(cube_rows, header, args_tuple)
 
-    if extracted_data:
-        extracted_data = np.array(extracted_data)
-        sorted_indices = np.argsort(wavelengths)
-        wavelengths = np.array(wavelengths)[sorted_indices]
-        extracted_data = extracted_data[sorted_indices, :]
 
-        extracted_data = extracted_data.T  # Invert so wavelengths are on y-axis
+def _prefetch(function, jobs, depth=4):
+    """
+    Yields function(job) for every job in order, running up to depth calls ahead
+    in background threads. Used to overlap FITS reads with the numpy reductions.
+    """
+    with ThreadPoolExecutor(max_workers=io_threads(depth)) as executor:
+        futures = deque()
+        for job in jobs:
+            futures.append(executor.submit(function, job))
+            if len(futures) > depth:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def extract_central_rows(parent_folder, target_piston_values, num_rows_to_accumulate=1, piston_values=None, max_workers=None,
+                         use_threads=False):
+    """
+    Extracts and sums central rows from FITS files at all the target piston values,
+    reading each FITS file only once.
 
+    Parameters:
+    parent_folder (str): Path to the parent folder containing timestamped subdirectories.
+    target_piston_values (numpy.ndarray): Piston values to extract.
+    num_rows_to_accumulate (int): Number of central rows to sum.
+    piston_values (numpy.ndarray, optional): Array of piston values of the cubes. If None, will be inferred from data.
+    max_workers (int, optional): Number of worker processes. If None, uses the number of CPUs; 1 runs serially with prefetched reads.
+    use_threads (bool): Read the files in max_workers threads (default: 4 per CPU, up to 32) and sum the rows in this process.
+
+    Returns:
+    tuple: (wavelengths, extracted_data) where extracted_data is 3D (piston, pixel, wavelength),
+    i.e. every plane is already laid out as a Fringe file (wavelengths along the last axis).
+    """
+    discovered_files = _discover_files(parent_folder)
+    if not discovered_files:
+        return None, None
+
+    target_piston_values = np.atleast_1d(np.asarray(target_piston_values, dtype=float))
+    wavelengths = [wavelength for wavelength, _, _ in discovered_files]
+    # The cubes normally share the same piston axis: map the target pistons once, from the first cube
+    index_table = _piston_index_table(discovered_files[0][1], target_piston_values, piston_values, discovered_files[0][2])
+    jobs = [(file, ext, wavelength, target_piston_values, num_rows_to_accumulate, piston_values, index_table)
+            for wavelength, file, ext in discovered_files]
+
+    # Every profile is stored straight at its sorted wavelength position of a preallocated
+    # (piston, pixel, wavelength) buffer, allocated once the image width is known
+    sorted_indices = np.argsort(wavelengths)
+    positions = np.empty_like(sorted_indices)
+    positions[sorted_indices] = np.arange(len(sorted_indices))
+    extracted_data = None
+
+    def store(k, profiles):
+        nonlocal extracted_data
+        if extracted_data is None:
+            extracted_data = np.empty((len(target_piston_values), profiles.shape[1], len(jobs)), dtype=np.float32)
+        extracted_data[:, :, positions[k]] = profiles
+
+    if use_threads or max_workers == 1:
+        # Reduction in this process, with the next cubes being read in background threads meanwhile.
+        # The reads are I/O bound, so more threads than CPUs keep the disk busy.
+        depth = (max_workers or min(32, (os.cpu_count() or 1) * 4)) if use_threads else 4
+        loaded = zip(_prefetch(_load_file_rows, jobs, depth), jobs)
+        for k, ((cube_rows, header), job) in enumerate(tqdm(loaded, total=len(jobs), desc="Reading PSF Files")):
+            store(k, _reduce_file_rows(cube_rows, header, job))
     else:
-        extracted_data = None
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_extract_file_profiles, jobs)
+            for k, profiles in enumerate(tqdm(results, total=len(jobs), desc="Reading PSF Files")):
+                store(k, profiles)
+
+    wavelengths = np.array(wavelengths)[sorted_indices]
+
+    return wavelengths, extracted_data
+
+
+def extract_central_row_at_piston(parent_folder, piston_value=-6000, num_rows_to_accumulate=1, piston_values=None):
+    """
+    Extracts and sums central rows from FITS files at a specified piston value.
 
+    Parameters:
+    parent_folder (str): Path to the parent folder containing timestamped subdirectories.
+    piston_value (float): Desired piston value.
+    num_rows_to_accumulate (int): Number of central rows to sum.
+    piston_values (numpy.ndarray, optional): Array of piston values. If None, will be inferred from data.
+
+    Returns:
+    tuple: (wavelengths, extracted_data) where extracted_data is 2D (y = wavelengths, x = pixels).
+    """
+    wavelengths, extracted_data = extract_central_rows(parent_folder, [piston_value], num_rows_to_accumulate,
+                                                       piston_values, max_workers=1)
+    if extracted_data is not None:
+        extracted_data = extracted_data[0]  # Already inverted so wavelengths are on y-axis
     return wavelengths, extracted_data
 
 
 def process_all_piston_values(parent_folder, output_folder="Fringes", num_rows_to_accumulate=1, 
-                               piston_min=None, piston_max=None, piston_step=None, piston_values=None):
+                               piston_min=None, piston_max=None, piston_step=None, piston_values=None,
+                               max_workers=None, use_threads=False, split_files=False):
     """
-    Iterates over all piston values and saves extracted data as FITS files.
+    Extracts the central rows at all piston values and saves them as FITS files.
+    Each PSF cube is read only once for all the piston values.
 
     Parameters:
     parent_folder (str): Path to the parent folder containing timestamped subdirectories.
@@ -185,9 +535,15 @@ def process_all_piston_values(parent_folder, output_folder="Fringes", num_rows_t
     piston_max (float, optional): Maximum piston value. If None, will try to read from FITS or use default.
     piston_step (float, optional): Step size for piston values. If None, will try to read from FITS or use default.
     piston_values (numpy.ndarray, optional): Explicit array of piston values. Overrides other parameters if provided.
+    max_workers (int, optional): Number of worker processes reading the PSF files and writing the Fringe files. If None, uses the number of CPUs.
+    use_threads (bool): Read the PSF files and write the Fringe files in thread pools instead of worker processes.
+    split_files (bool): Also save every piston as its own Fringe_XXXXX.fits file, besides the Fringes.fits cube.
     """
     os.makedirs(output_folder, exist_ok=True)
 
+    # Rescan the input folders on every run, new PSF files may have been simulated since the last one
+    _discover_files.cache_clear()
+
     # Determine piston values: explicit array > read from FITS > command-line args > defaults
     if piston_values is None:
         # Try to read from FITS files first
@@ -210,55 +566,60 @@ def process_all_piston_values(parent_folder, output_folder="Fringes", num_rows_t
     else:
         print(f"Using provided piston values: {len(piston_values)} values from {piston_values[0]:.1f} to {piston_values[-1]:.1f}")
     all_filenames = []
-    processed_wavelengths = None # To store wavelengths from the first successful extraction
 
-    for i, piston_value in enumerate(tqdm(piston_values, desc="Processing Piston Values")):
-        #print(f"Processing piston value {piston_value} nm ({i+1}/{len(piston_values)})...")
-
-        wavelengths, extracted_data = extract_central_row_at_piston(parent_folder, piston_value, num_rows_to_accumulate, piston_values)
-
-        if extracted_data is not None and extracted_data.size > 0:
-            if processed_wavelengths is None and wavelengths is not None and len(wavelengths) > 0:
-                processed_wavelengths = wavelengths # Store wavelengths from first valid data
-
-            # Normalize extracted_data to 0-1 range
-            min_val = np.min(extracted_data)
-            max_val = np.max(extracted_data)
-            if max_val > min_val: # Avoid division by zero if data is flat
-                normalized_data = (extracted_data - min_val) / (max_val - min_val)
+    # Read every PSF cube once, extracting the central rows at all piston values
+    processed_wavelengths, fringes = extract_central_rows(parent_folder, piston_values, num_rows_to_accumulate,
+                                                          piston_values, max_workers, use_threads)
+    if fringes is None or fringes.size == 0:
+        print("No data extracted from the PSF files. Skipping fringe file save.")
+        processed_wavelengths = None
+    else:
+        # Normalize every piston in place: the extraction buffer is already laid out as
+        # the Fringe files (inverted so wavelengths are on y-axis) and becomes the output cube
+        all_fringes = fringes
+        for i in tqdm(range(len(piston_values)), desc="Normalizing Fringes"):
+            all_fringes[i] = _normalize(all_fringes[i])
+
+        # Create FITS header
+        cards = [('WAVMIN', np.min(processed_wavelengths), "Minimum wavelength (nm)"),
+                 ('WAVMAX', np.max(processed_wavelengths), "Maximum wavelength (nm)")]
+        if len(processed_wavelengths) > 1:
+            cards.append(('WAVSTP', processed_wavelengths[1] - processed_wavelengths[0], "Wavelength step (nm)"))
+        else:
+            cards.append(('WAVSTP', 0, "Wavelength step (nm)")) # Or some other default if only one wavelength
+
+        # Save all the fringes as a single cube, written with one open and one header.
+        # The per-piston header values go in a binary table extension, one row per plane.
+        fringe_table = np.empty(len(piston_values), dtype=[('PSTVAL', 'f8'), ('WAVMIN', 'f8'), ('WAVMAX', 'f8'), ('WAVSTP', 'f8')])
+        fringe_table['PSTVAL'] = piston_values
+        for keyword, value, _ in cards:
+            fringe_table[keyword] = value
+        _write_fits(os.path.join(output_folder, "Fringes.fits"), all_fringes,
+                    cards + [('PSTMIN', np.min(piston_values), "Minimum piston value (nm)"),
+                             ('PSTMAX', np.max(piston_values), "Maximum piston value (nm)")],
+                    table=fringe_table, table_name='FRINGES')
+
+        if split_files:
+            # Save the normalized 2D data of every piston as its own FITS file with header.
+            # The writes run in worker processes (threads with --threads or a single worker):
+            # astropy header serialization holds the GIL.
+            cards = tuple(cards)
+            jobs = ((os.path.join(output_folder, f"Fringe_{i:05d}.fits"), all_fringes[i], piston_values[i], cards)
+                    for i in range(len(piston_values)))
+            if use_threads or max_workers == 1:
+                executor, chunksize = ThreadPoolExecutor(max_workers=io_threads(8)), 1
             else:
-                normalized_data = extracted_data # Or np.zeros_like(extracted_data) if appropriate
-
-            # Create FITS header
-            hdr = fits.Header()
-            if processed_wavelengths is not None and len(processed_wavelengths) > 0:
-                hdr['WAVMIN'] = (np.min(processed_wavelengths), "Minimum wavelength (nm)")
-                hdr['WAVMAX'] = (np.max(processed_wavelengths), "Maximum wavelength (nm)")
-                if len(processed_wavelengths) > 1:
-                    hdr['WAVSTP'] = (processed_wavelengths[1] - processed_wavelengths[0], "Wavelength step (nm)")
-                else:
-                    hdr['WAVSTP'] = (0, "Wavelength step (nm)") # Or some other default if only one wavelength
-            else: # Fallback if wavelengths are somehow not available
-                hdr['WAVMIN'] = ('UNKNOWN', "Minimum wavelength (nm)")
-                hdr['WAVMAX'] = ('UNKNOWN', "Maximum wavelength (nm)")
-                hdr['WAVSTP'] = ('UNKNOWN', "Wavelength step (nm)")
-            hdr['PSTVAL'] = (piston_value, "Piston value (nm)")
-            
-            # Save the normalized 2D data as a FITS file with header
-            fringe_filename = os.path.join(output_folder, f"Fringe_{i:05d}.fits")
-            fits.writeto(fringe_filename, normalized_data, header=hdr, overwrite=True)
-            all_filenames.append(fringe_filename)
-        elif extracted_data is None:
-            print(f"No data extracted for piston value {piston_value}. Skipping file save.")
-        elif extracted_data.size == 0:
-            print(f"Empty data extracted for piston value {piston_value}. Skipping file save.")
-
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+                chunksize = max(1, len(piston_values) // (4 * (max_workers or os.cpu_count() or 1)))
+            with executor:
+                all_filenames = list(tqdm(executor.map(_write_fringe, jobs, chunksize=chunksize),
+                                          total=len(piston_values), desc="Writing Fringe Files"))
 
     # Save wavelengths and piston values as FITS files
     if processed_wavelengths is not None:
-        fits.writeto(os.path.join(output_folder, "Lambda.fits"), np.array(processed_wavelengths), overwrite=True)
+        _write_fits(os.path.join(output_folder, "Lambda.fits"), np.array(processed_wavelengths))
 
-    fits.writeto(os.path.join(output_folder, "Differential_piston.fits"), piston_values, overwrite=True)
+    _write_fits(os.path.join(output_folder, "Differential_piston.fits"), np.asarray(piston_values))
 
     print("Processing complete! All FITS files saved in:", output_folder)
 
@@ -272,6 +633,9 @@ def createFringes():
     parser.add_argument("--piston_max", type=float, default=None, help="Maximum piston value in nm (default: read from FITS or 6000).")
     parser.add_argument("--piston_step", type=float, default=None, help="Step size for piston values in nm (default: read from FITS or 5).")
     parser.add_argument("--piston_file", type=str, default=None, help="Path to FITS file containing piston values array (overrides other piston options).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes reading the PSF files and writing the Fringe files (default: number of CPUs).")
+    parser.add_argument("--split_files", action="store_true", help="Also save every piston as its own Fringe_XXXXX.fits file (the layout used before Fringes.fits).")
+    parser.add_argument("--threads", action="store_true", help="Read the PSF files in a thread pool of --workers threads, and write the Fringe files in threads, instead of worker processes.")
 
     args = parser.parse_args()
 
@@ -280,12 +644,11 @@ def createFringes():
     if args.piston_file:
         if os.path.exists(args.piston_file):
             try:
-                with fits.open(args.piston_file) as hdul:
-                    piston_values = hdul[0].data
-                    if piston_values is not None:
-                        print(f"Loaded piston values from {args.piston_file}")
-                    else:
-                        print(f"Warning: No data found in {args.piston_file}")
+                piston_values = _read_data(args.piston_file)
+                if piston_values is not None:
+                    print(f"Loaded piston values from {args.piston_file}")
+                else:
+                    print(f"Warning: No data found in {args.piston_file}")
             except Exception as e:
                 print(f"Error reading piston values from {args.piston_file}: {e}")
                 return
@@ -294,7 +657,8 @@ def createFringes():
             return
 
     process_all_piston_values(args.parent_folder, args.output_folder, args.num_rows, 
-                             args.piston_min, args.piston_max, args.piston_step, piston_values)
+                             args.piston_min, args.piston_max, args.piston_step, piston_values,
+                             max_workers=args.workers, use_threads=args.threads, split_files=args.split_files)
 
 
 if __name__ == "__main__":
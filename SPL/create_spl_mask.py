@@ -1,11 +1,99 @@
-import cupy as cp
+import math
 import numpy as np
-import matplotlib.pyplot as plt
 from astropy.io import fits
 import argparse
 import os
+import functools
+from fits_io import writeto
 
-def createSplMask(pixel_pupil, gap=0.0, clock_angle=0.0, filename="mymask.fits"):
+try:
+    import numba  # Optional: compiled single-pass mask kernel
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _mask_kernel(lo, radius, cos_theta, sin_theta, half_gap, out):
+        # Circle and gap tests fused in one pass over the grid, rows split across cores.
+        # No fastmath: the comparisons must round exactly as the numpy version does.
+        r2 = radius * radius
+        for i in numba.prange(out.shape[0]):
+            y = i + lo
+            for j in range(out.shape[1]):
+                x = j + lo
+                out[i, j] = (x * x + y * y <= r2) and abs(x * cos_theta + y * sin_theta) > half_gap
+
+def _mask_block(y, x, radius, cos_theta, sin_theta, half_gap):
+    """
+    Evaluates the SPL mask on the grid spanned by the y (column) and x (row) coordinate vectors.
+
+    :return: 2D boolean array, True inside the circle and outside the gap.
+    """
+    shape = np.broadcast_shapes(y.shape, x.shape)
+
+    # Inside the circle: exact integer arithmetic in the dtype of the coordinates
+    # (int32 for the usual sizes), half the bytes of a float64 pass
+    squared = np.empty(shape, dtype=np.result_type(x, y))
+    np.add(x * x, y * y, out=squared)
+    block = squared <= radius**2
+    del squared
+
+    # Outside the gap: only the rotated coordinate across it is needed. It stays in
+    # float64, float32 rounding would move the pixels on the gap edges. The broadcast
+    # operands stay 1D and the ufuncs write in place
+    buffer = np.empty(shape)
+    np.add(x * cos_theta, y * sin_theta, out=buffer)
+    np.abs(buffer, out=buffer)
+    block &= buffer > half_gap
+    return block
+
+@functools.lru_cache(maxsize=32)
+def _build_mask(pixel_pupil, gap, clock_angle):
+    """
+    Computes the SPL mask (see createSplMask). It is a pure function of the three parameters,
+    so the last masks are cached: repeated calls with the same parameters (e.g. GUI clicks) skip the computation.
+
+    :return: 2D read-only boolean array, True inside the circle and outside the gap.
+    """
+    # Create coordinate axes (the mask is too small to pay off a GPU round trip, numpy is used).
+    # int32 holds x*x + y*y up to 46340 pixels
+    lo = -pixel_pupil//2
+    coords = np.arange(lo, pixel_pupil//2, dtype=np.int32 if pixel_pupil <= 46340 else np.int64)
+
+    # Compute radius as half the frame size (circle touches the edges)
+    radius = pixel_pupil / 2
+
+    # Convert clock angle to radians
+    theta = math.radians(clock_angle)
+
+    # Convert gap width from fraction to pixel units
+    gap_width = gap * pixel_pupil
+
+    # The rotation coefficients are Python floats
+    params = (radius, math.cos(theta), math.sin(theta), gap_width / 2)
+
+    # Create mask (1 inside the circle, 0 outside) with a zero-filled rotated rectangle.
+    # Circle and gap are both symmetric through the origin, (x, y) -> (-x, -y), so without
+    # numba only the rows with y <= 0 are computed; the others are mirrored from them. Coordinate c
+    # sits at index c - lo, so its mirror -c sits at index -2*lo - index.
+    mask = np.empty((pixel_pupil, pixel_pupil), dtype=bool)
+    if numba is not None:
+        # Compiled kernel: a single pass without temporaries, no mirroring needed
+        _mask_kernel(lo, *params, mask)
+    else:
+        split = np.searchsorted(coords, 0, side='right')  # Rows with y <= 0
+        mask[:split] = _mask_block(coords[:split, None], coords[None, :], *params)
+        if split < pixel_pupil:
+            mirror = -2 * lo
+            first = mirror - (pixel_pupil - 1)  # Mirror of the last row/column
+            first_col = max(0, first)  # Columns before it have their mirror outside the grid
+            mask[split:, first_col:] = mask[first:mirror - split + 1, first:mirror - first_col + 1][::-1, ::-1]
+            mask[split:, :first_col] = _mask_block(coords[split:, None], coords[None, :first_col], *params)
+    
+    mask.flags.writeable = False  # Shared by the calls with the same parameters
+    return mask
+
+def createSplMask(pixel_pupil, gap=0.0, clock_angle=0.0, filename="mymask.fits", show=False):
     """
     Creates a circular mask that is tangent to the edges of the square pupil frame,
     with an optional zero-filled rectangular gap.
@@ -14,46 +102,32 @@ def createSplMask(pixel_pupil, gap=0.0, clock_angle=0.0, filename="mymask.fits")
     :param gap: Width of the rectangular gap as a fraction of the diameter.
     :param clock_angle: Angle of the gap in degrees (0° = horizontal, 90° = vertical).
     :param filename: Name of the file to save the mask.
-    :return: 2D cupy array with a circular mask (1 inside the circle, 0 outside),
+    :param show: Display the mask with matplotlib (blocks until the window is closed).
+    :return: 2D numpy array with a circular mask (1 inside the circle, 0 outside),
              with a zero-filled rectangle superimposed.
     """
     # Ensure the filename ends with '.fits'
     if not filename.endswith('.fits'):
         filename += '.fits'
 
-    # Create coordinate grid
-    y, x = cp.ogrid[-pixel_pupil//2:pixel_pupil//2, -pixel_pupil//2:pixel_pupil//2]
-
-    # Compute radius as half the frame size (circle touches the edges)
-    radius = pixel_pupil / 2
-
-    # Create mask (1 inside the circle, 0 outside)
-    mask = (x**2 + y**2) <= radius**2
-
-    # Convert clock angle to radians
-    theta = np.radians(clock_angle)
-
-    # Convert gap width from fraction to pixel units
-    gap_width = gap * pixel_pupil
+    mask = _build_mask(pixel_pupil, gap, clock_angle)
 
-    # Apply 2D rotation matrix to the grid
-    x_rot = x * cp.cos(theta) + y * cp.sin(theta)
-    y_rot = -x * cp.sin(theta) + y * cp.cos(theta)
+    # 0/1 values as 8-bit integers: a zero-copy view of the boolean mask
+    mask_u8 = mask.view(np.uint8)
 
-    # Create rectangular gap by setting mask values to 0 inside the rotated rectangle
-    mask[cp.abs(x_rot) <= (gap_width / 2)] = 0
-    
-    # Save mask as a FITS file
+    # Save mask as a FITS file (BITPIX = 8, 8x smaller than float64)
     savename = os.path.join(".\calib\data", filename)
     os.makedirs(os.path.dirname(savename), exist_ok=True)
-    fits.writeto(savename, cp.asnumpy(mask.astype(float)), overwrite=True)
+    writeto(fits.HDUList([fits.PrimaryHDU(mask_u8)]), savename)
     print("File saved as", savename)
 
-    # Display the mask
-    plt.imshow(cp.asnumpy(mask.astype(float)), cmap='gray', origin='upper')
-    plt.title(f"Circular Mask with Zero-Filled Rectangle (Gap={gap}, Angle={clock_angle}°)")
-    plt.colorbar()
-    plt.show()
+    # Display the mask (pyplot is imported only here, batch runs skip the backend startup)
+    if show:
+        import matplotlib.pyplot as plt
+        plt.imshow(mask_u8, cmap='gray', origin='upper')
+        plt.title(f"Circular Mask with Zero-Filled Rectangle (Gap={gap}, Angle={clock_angle}°)")
+        plt.colorbar()
+        plt.show()
 
     return mask.astype(float)
 
@@ -63,8 +137,9 @@ if __name__ == "__main__":
     parser.add_argument("--gap", type=float, default=0.0, help="Width of the gap as a fraction of the diameter (default=0.0).")
     parser.add_argument("--clock_angle", type=float, default=0.0, help="Clock angle of the gap in degrees (default=0.0).")
     parser.add_argument("--filename", type=str, default="mymask.fits", help="Name of the file to save the mask (default='mymask.fits').")
+    parser.add_argument("--show", action="store_true", help="Display the mask after saving it.")
     
     args = parser.parse_args()
 
     # Generate the mask with the given arguments
-    createSplMask(args.pixel_pupil, gap=args.gap, clock_angle=args.clock_angle, filename=args.filename)
+    createSplMask(args.pixel_pupil, gap=args.gap, clock_angle=args.clock_angle, filename=args.filename, show=args.show)
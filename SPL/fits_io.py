@@ -0,0 +1,32 @@
+import io
+
+try:
+    import fitsio  # Optional: faster CFITSIO-based reads and writes
+except ImportError:
+    fitsio = None
+
+
+def io_threads(n):
+    """
+    Returns how many threads may do FITS I/O at the same time: n, or 1 when
+    fitsio links a CFITSIO build that is not thread safe.
+    """
+    if fitsio is None or getattr(fitsio, 'cfitsio_is_reentrant', lambda: False)():
+        return n
+    return 1
+
+
+def writeto(hdul, filename):
+    """
+    Writes an astropy HDUList to filename.
+
+    Parameters:
+    hdul (fits.HDUList): HDUs to save
+    filename (str): path of the output FITS file
+    """
+    # Serialize the FITS file in memory and write it with a single call:
+    # much faster than many small writes on network drives
+    buffer = io.BytesIO()
+    hdul.writeto(buffer)
+    with open(filename, 'wb') as f:
+        f.write(buffer.getbuffer())
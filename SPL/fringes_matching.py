@@ -1,33 +1,100 @@
 import os
 import numpy as np
 from astropy.io import fits
-from scipy import signal
-from skimage.registration import phase_cross_correlation
-from skimage.feature import match_template
-import matplotlib
-matplotlib.use('Agg')  # Set a non-interactive backend BEFORE importing pyplot
-import matplotlib.pyplot as plt
 import re
+import json
 import argparse
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from fits_io import io_threads
+
+try:
+    import fitsio  # Optional: faster CFITSIO-based reads
+except ImportError:
+    fitsio = None
+
+try:
+    import numba  # Optional: compiled NCC kernel (engine='numba')
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath={'reassoc', 'contract'}, cache=True)
+    def _ncc_kernel(template_matrix, target_flat, dots):
+        # Dot product of every normalized template row with the target, templates split
+        # across cores. Only reassociation is allowed, so the nan rows of flat templates
+        # still give nan scores instead of undefined results.
+        for k in numba.prange(template_matrix.shape[0]):
+            dot = 0.0
+            for i in range(template_matrix.shape[1]):
+                dot += template_matrix[k, i] * target_flat[i]
+            dots[k] = dot
+
+    @numba.njit(cache=True)
+    def _minmax_kernel(data):
+        # Min and max in a single pass over the flattened data (nan propagates, as np.min)
+        lo = data[0]
+        hi = data[0]
+        for i in range(data.shape[0]):
+            value = data[i]
+            if value != value:
+                return value, value
+            if value < lo:
+                lo = value
+            elif value > hi:
+                hi = value
+        return lo, hi
+
+    @numba.njit(parallel=True, cache=True)
+    def _normalize_kernel(data, lo, span, out):
+        # (data - lo) / span in one pass split across cores, no temporaries
+        for i in numba.prange(data.shape[0]):
+            out[i] = (data[i] - lo) / span
+
+def _use_numba(image):
+    """Whether the numba kernels can process the image: native byte order integers, float32 or float64."""
+    return numba is not None and image.dtype.isnative and (image.dtype.kind in 'iu' or image.dtype in (np.float32, np.float64))
+
+def _minmax(image):
+    """Minimum and maximum of an image, in one pass with numba, else np.min and np.max."""
+    if _use_numba(image):
+        img_min, img_max = _minmax_kernel(image.ravel())
+        return image.dtype.type(img_min), image.dtype.type(img_max)
+    return np.min(image), np.max(image)
 
 def is_image_normalized(image, epsilon=1e-6):
     """Check if image is normalized to range [0-epsilon, 1+epsilon]."""
     if image is None or not isinstance(image, np.ndarray) or image.size == 0:
         return False # Cannot determine for empty or invalid data
     
-    img_min = np.min(image)
-    img_max = np.max(image)
+    img_min, img_max = _minmax(image)
     
     # Handles flat images as well. If img_min == img_max, it checks if that value is in [0,1]
     if img_min >= (0.0 - epsilon) and img_max <= (1.0 + epsilon):
         return True
     return False
 
-def load_fits_image_and_header(file_path):
-    """Load a FITS file and return its data array and header."""
-    with fits.open(file_path) as hdul:
+def load_fits_image_and_header(file_path, cols=None):
+    """Load a FITS file and return its data array and header (data is None for an empty HDU).
+    cols (slice, optional): read only these columns (last axis) off disk, clipped to the data width.
+    Uses fitsio when installed; both header types support header['KEYWORD']."""
+    if fitsio is not None:
+        with fitsio.FITS(file_path) as f:
+            # Assuming the data is in the primary HDU
+            hdu = f[0]
+            if not hdu.has_data():
+                return None, hdu.read_header()
+            if cols is None:
+                return hdu.read(), hdu.read_header()
+            return hdu[(slice(None),) * (len(hdu.get_dims()) - 1) + (cols,)], hdu.read_header()
+    with fits.open(file_path, memmap=True, lazy_load_hdus=True) as hdul:
         # Assuming the data is in the primary HDU
-        return hdul[0].data, hdul[0].header
+        hdu = hdul[0]
+        if cols is None or hdu.header['NAXIS'] == 0:
+            return hdu.data, hdu.header
+        # section reads only the requested columns, the full image is never loaded
+        return hdu.section[(slice(None),) * (hdu.header['NAXIS'] - 1) + (cols,)], hdu.header
 
 def load_lambda_array(lambda_file_path):
     """Load the Lambda.fits file containing wavelength array for templates."""
@@ -35,6 +102,8 @@ def load_lambda_array(lambda_file_path):
         print(f"Error: Lambda file not found at {lambda_file_path}")
         return None
     try:
+        if fitsio is not None:
+            return fitsio.read(lambda_file_path, ext=0)
         with fits.open(lambda_file_path) as hdul:
             return hdul[0].data
     except Exception as e:
@@ -45,20 +114,92 @@ def normalize_image(image):
     """Normalize image to range [0, 1]."""
     if image is None or image.size == 0:
         return image # Or handle as an error/empty image
-    img_min = np.min(image)
-    img_max = np.max(image)
+    img_min, img_max = _minmax(image)
     if img_max > img_min:
+        if _use_numba(image):
+            # Same arithmetic and result type as the numpy expression, written in a single pass
+            normalized = np.empty(image.size, dtype=image.dtype if image.dtype.kind == 'f' else np.float64)
+            _normalize_kernel(image.ravel(), img_min, img_max - img_min, normalized)
+            return normalized.reshape(image.shape)
         return (image - img_min) / (img_max - img_min)
     # Handle flat images (all pixels same value)
     # Current behavior: flat images become all zeros.
     # If img_min == img_max, it returns np.zeros_like(image).
     return np.zeros_like(image) if img_min == img_max else image # Note: 'else image' is unreachable here.
 
-def match_fringe_pattern(target_image_normalized, template_images, are_templates_pre_normalized, method='cross_correlation'):
+def _normalized_rows(templates):
+    """
+    Stack equally shaped templates as zero-mean, unit-norm rows (nan rows for flat templates),
+    so that their correlations with a zero-mean target are plain dot products.
+    The statistics are computed in float64, the rows are stored as float32: the products
+    then run in single precision (SGEMV), moving half the bytes.
+    """
+    template_matrix = np.array(templates, dtype=np.float64).reshape(len(templates), -1)
+    template_matrix -= template_matrix.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        template_matrix /= np.linalg.norm(template_matrix, axis=1, keepdims=True)
+    return template_matrix.astype(np.float32)
+
+# Downsampling step of the coarse pass of coarse-to-fine matching (top_k)
+_COARSE_STEP = 4
+
+def _batched_ncc(target, templates, engine='numpy', flat_score=-np.inf, template_matrix=None):
+    """
+    Normalized cross-correlation of the target with every template, as one matrix product
+    per crop shape instead of one np.corrcoef call per template. Target and template are
+    cropped to their smallest overlapping region, as in the per-template comparison.
+    engine: 'numpy' (BLAS matrix product) or 'numba' (parallel compiled kernel).
+    flat_score: score of flat (or nan) templates or target.
+    template_matrix: _normalized_rows of all the templates, used when the target covers them whole.
+    Returns: numpy array of scores, -inf for invalid templates and flat_score for flat ones.
+    """
+    scores = np.full(len(templates), -np.inf)
+
+    # Templates of the same shape share the same crop (usually all of them)
+    groups = {}
+    for k, template in enumerate(templates):
+        if template is None or template.shape[0] == 0 or template.shape[1] == 0:
+            continue # Penalize invalid templates
+        crop_shape = (min(target.shape[0], template.shape[0]), min(target.shape[1], template.shape[1]))
+        groups.setdefault(crop_shape, []).append(k)
+
+    for (min_rows, min_cols), indices in groups.items():
+        # Normalized template rows and zero-mean target: the correlations are their dot products
+        # divided by the target norm. The template statistics are computed once by load_all_templates,
+        # here only when the templates are cropped to a smaller target.
+        if template_matrix is not None and len(indices) == len(template_matrix) and templates[indices[0]].shape == (min_rows, min_cols):
+            group_matrix = template_matrix
+        else:
+            group_matrix = _normalized_rows([templates[k][:min_rows, :min_cols] for k in indices])
+        target_flat = target[:min_rows, :min_cols].astype(np.float64).ravel()
+        target_flat -= target_flat.mean()
+        target_norm = np.linalg.norm(target_flat)
+        target_flat = target_flat.astype(np.float32) # Same precision as the template rows
+
+        # Flat images have zero norm: their nan/inf scores are replaced, as np.corrcoef nan
+        if engine == 'numba':
+            dots = np.empty(len(indices))
+            _ncc_kernel(group_matrix, target_flat, dots)
+        else:
+            dots = group_matrix @ target_flat
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlations = dots / target_norm
+        scores[indices] = np.where(np.isfinite(correlations), correlations, flat_score)
+    return scores
+
+def match_fringe_pattern(target_image_normalized, template_images, are_templates_pre_normalized, method='cross_correlation', engine='numpy', template_matrix=None,
+                         top_k=None, coarse_matrix=None):
     """
     Match a target fringe pattern with a repository of template images.
     Assumes target_image_normalized is already normalized and wavelength-cropped.
-    Templates are wavelength-cropped. are_templates_pre_normalized indicates if template set is considered normalized.
+    Templates are wavelength-cropped. are_templates_pre_normalized indicates if template set is considered normalized;
+    the templates are not normalized again here: the normalized correlations are invariant to the min-max normalization.
+    method: 'cross_correlation', 'template_matching' or 'opencv_ncc' (requires OpenCV).
+    engine selects the correlation implementation of the first two methods: 'numpy' or 'numba'.
+    template_matrix (optional) holds the precomputed template statistics returned by load_all_templates.
+    top_k (optional, first two methods): coarse-to-fine matching. All the templates are first scored on
+    images downsampled by _COARSE_STEP, then only the top_k best are scored at full resolution; the others
+    score -inf. coarse_matrix (optional) holds the downsampled template statistics returned by load_all_templates.
     """
     match_scores = []
     
@@ -68,65 +209,56 @@ def match_fringe_pattern(target_image_normalized, template_images, are_templates
 
     # Target image is already normalized by the caller (main function)
     target_norm = target_image_normalized
-    
-    for template in template_images:
-        if template is None or template.shape[0] == 0 or template.shape[1] == 0:
-            match_scores.append(-np.inf) # Penalize invalid templates
-            continue
 
-        # Conditionally normalize the template based on the check performed on the first template
-        if are_templates_pre_normalized:
-            template_norm = normalize_image(template)
+    if method in ('cross_correlation', 'template_matching'):
+        if engine == 'numba' and numba is None:
+            print("Warning: numba is not installed, using the numpy engine.")
+            engine = 'numpy'
+        # All the templates are compared with one matrix product instead of a np.corrcoef call each.
+        # Target and template are cropped to the same shape, so match_template would return the
+        # single zero-shift value of the same normalized correlation: no FFT is needed, only
+        # its convention of scoring flat windows 0 instead of penalizing them.
+        flat_score = 0.0 if method == 'template_matching' else -np.inf
+        if top_k is not None and 0 < top_k < len(template_images):
+            # Coarse pass on every _COARSE_STEP-th row and column (~16x fewer operations),
+            # then the full resolution pass only on the top_k candidates
+            coarse_templates = [template if template is None else template[::_COARSE_STEP, ::_COARSE_STEP] for template in template_images]
+            coarse_scores = _batched_ncc(target_norm[::_COARSE_STEP, ::_COARSE_STEP], coarse_templates, engine, flat_score, coarse_matrix)
+            candidates = np.argpartition(coarse_scores, -top_k)[-top_k:]
+            scores = np.full(len(template_images), -np.inf) # Rejected templates
+            scores[candidates] = _batched_ncc(target_norm, [template_images[k] for k in candidates], engine, flat_score,
+                                              None if template_matrix is None else template_matrix[candidates])
+            match_scores = scores.tolist()
         else:
-            template_norm = template # Use as-is, warning was issued by load_all_templates
-        
-        # Ensure same dimensions for matching by cropping to the smallest overlapping region
-        # This is after wavelength cropping has already aligned them spectrally.
-        min_rows = min(target_norm.shape[0], template_norm.shape[0])
-        min_cols = min(target_norm.shape[1], template_norm.shape[1])
-        
-        target_crop = target_norm[:min_rows, :min_cols]
-        template_crop = template_norm[:min_rows, :min_cols]
-
-        if target_crop.size == 0 or template_crop.size == 0:
-            match_scores.append(-np.inf)
-            continue
-        
-        if method == 'cross_correlation':
-            # Compute normalized cross-correlation
-            # Ensure inputs are 1D for corrcoef if they are not already
-            target_flat = target_crop.flatten()
-            template_flat = template_crop.flatten()
-            if target_flat.size != template_flat.size or target_flat.size == 0:
-                match_scores.append(-np.inf) # Should not happen if min_rows/cols > 0
+            match_scores = _batched_ncc(target_norm, template_images, engine, flat_score, template_matrix).tolist()
+    elif method == 'opencv_ncc':
+        # OpenCV is optional and imported only for this method
+        try:
+            import cv2
+        except ImportError:
+            print("Error: method 'opencv_ncc' requires OpenCV (pip install opencv-python).")
+            return -1, []
+        # cv2.matchTemplate (TM_CCOEFF_NORMED) runs the SIMD/IPP-optimized correlation in float32.
+        # Target and template are cropped to their smallest overlapping region, as in the other
+        # methods, so each call returns the single zero-shift coefficient.
+        target32 = np.asarray(target_norm, dtype=np.float32)
+        for template in template_images:
+            if template is None or template.shape[0] == 0 or template.shape[1] == 0:
+                match_scores.append(-np.inf) # Penalize invalid templates
                 continue
-            # np.corrcoef can return nan if one of the inputs has zero variance (e.g. flat image)
-            correlation_matrix = np.corrcoef(target_flat, template_flat)
-            if np.isnan(correlation_matrix).any() or correlation_matrix.shape != (2,2):
-                 correlation = -np.inf # Penalize
-            else:
-                correlation = correlation_matrix[0, 1]
-            match_scores.append(correlation)
-            
-        elif method == 'template_matching':
-            # Template matching
-            # match_template requires template to be smaller than image
-            if template_crop.shape[0] > target_crop.shape[0] or template_crop.shape[1] > target_crop.shape[1]:
-                # If template is larger, try to match target as template in template_crop
-                # This case should ideally be handled by the min_rows/min_cols cropping,
-                # but as a fallback:
-                if target_crop.shape[0] <= template_crop.shape[0] and target_crop.shape[1] <= template_crop.shape[1]:
-                     result = match_template(template_crop, target_crop)
-                else: # Cannot make them compatible for match_template
-                    match_scores.append(-np.inf)
-                    continue
-            else:
-                result = match_template(target_crop, template_crop)
-            
-            if result.size > 0:
-                match_scores.append(np.max(result))
-            else:
-                match_scores.append(-np.inf) # Penalize if result is empty
+            min_rows = min(target32.shape[0], template.shape[0])
+            min_cols = min(target32.shape[1], template.shape[1])
+            target_crop = np.ascontiguousarray(target32[:min_rows, :min_cols])
+            template_crop = np.ascontiguousarray(template[:min_rows, :min_cols], dtype=np.float32)
+            # OpenCV scores flat images 1: they are penalized instead, as the np.corrcoef nan
+            if np.ptp(target_crop) == 0 or np.ptp(template_crop) == 0:
+                match_scores.append(-np.inf)
+                continue
+            score = float(cv2.matchTemplate(target_crop, template_crop, cv2.TM_CCOEFF_NORMED).max())
+            match_scores.append(score if np.isfinite(score) else -np.inf)
+    else:
+        print(f"Error: unknown matching method '{method}'.")
+        return -1, []
     
     if not match_scores: # No valid templates or all comparisons failed
         return -1, match_scores
@@ -139,22 +271,61 @@ def match_fringe_pattern(target_image_normalized, template_images, are_templates
 
     return best_match_idx, match_scores
 
+def _load_template(template_file, cols=None):
+    """Thread pool entry point: read the data of a (filename, file_path, image_data) template entry
+    when image_data is None, only the cols columns. Unreadable files get None data and are skipped by the caller."""
+    filename, file_path, image_data = template_file
+    if image_data is None:
+        try:
+            # Assuming load_fits_image_and_header now just returns data for templates
+            image_data, _ = load_fits_image_and_header(file_path, cols) # We don't need header for individual templates here
+        except Exception:
+            image_data = None
+    return filename, file_path, image_data
+
+# Template file names (Fringe_XXXXX.fits), the group is the fringe ID
+_FRINGE_RE = re.compile(r'Fringe_(\d+)\.fits$')
+
+def _iter_template_files(template_dir, cols=None):
+    """
+    Yield (filename, file_path, image_data) for every template in template_dir.
+    When the Fringes.fits cube written by create_fringes.py exists, its planes are yielded
+    under the equivalent Fringe_XXXXX.fits names (one file open for all the templates, only
+    the cols columns are read); otherwise the individual Fringe_*.fits files are listed and
+    image_data is None.
+    """
+    cube_path = os.path.join(template_dir, 'Fringes.fits')
+    if os.path.isfile(cube_path):
+        cube, _ = load_fits_image_and_header(cube_path, cols)
+        if cube is not None and cube.ndim == 3:
+            for i, plane in enumerate(cube):
+                filename = f"Fringe_{i:05d}.fits"
+                yield filename, os.path.join(template_dir, filename), plane
+            return
+    with os.scandir(template_dir) as entries:
+        filenames = [entry.name for entry in entries if _FRINGE_RE.match(entry.name)]
+    # Sorted by fringe ID (Fringe_10 after Fringe_9 whatever the zero padding), also a consistent order for the first template check
+    for filename in sorted(filenames, key=lambda name: int(_FRINGE_RE.match(name).group(1))):
+        yield filename, os.path.join(template_dir, filename), None
+
 def load_all_templates(template_dir, target_min_wave, target_max_wave, template_lambda_values):
-    """Load all Fringe_*.fits templates, cropped to target wavelength range.
+    """Load all Fringe_*.fits templates (or the planes of Fringes.fits), cropped to target wavelength range.
     Checks the first loaded template for normalization.
-    Returns: templates_data, template_paths, skipped_files, are_templates_pre_normalized (bool)
+    Returns: templates_data, template_paths, skipped_files, are_templates_pre_normalized (bool),
+    template_matrix (zero-mean, unit-norm template rows for match_fringe_pattern, None if the shapes differ),
+    template_pistons (differential piston value of every template, None where unavailable),
+    coarse_matrix (same as template_matrix for the templates downsampled by _COARSE_STEP)
     """
     templates_data = []
     template_paths = []
     skipped_files = 0
-    fringe_pattern = re.compile(r'Fringe_\d+\.fits$')
     
     first_template_checked_for_norm = False
     are_templates_pre_normalized = True # Assume true until checked
 
     if template_lambda_values is None or template_lambda_values.size == 0:
         print("Error: Template lambda array is missing or empty. Cannot crop templates.")
-        return [], [], 0, are_templates_pre_normalized
+        return [], [], 0, are_templates_pre_normalized, None, [], None
 
     # Find column indices in template_lambda_values for cropping
     template_col_start_idx = np.searchsorted(template_lambda_values, target_min_wave, side='left')
@@ -162,7 +333,7 @@ def load_all_templates(template_dir, target_min_wave, target_max_wave, template_
 
     if template_col_start_idx > template_col_end_idx or template_col_start_idx >= len(template_lambda_values) or template_col_end_idx < 0:
         print(f"Warning: Target wavelength range [{target_min_wave:.2f}-{target_max_wave:.2f} nm] does not overlap with template wavelength data or is invalid.")
-        return [], [], 0, are_templates_pre_normalized
+        return [], [], 0, are_templates_pre_normalized, None, [], None
     
     # Ensure indices are within the bounds of template_lambda_values
     template_col_start_idx = max(0, template_col_start_idx)
@@ -170,114 +341,195 @@ def load_all_templates(template_dir, target_min_wave, target_max_wave, template_
 
     if template_col_start_idx > template_col_end_idx: # Check again after clamping
         print(f"Warning: Clamped target wavelength range [{template_lambda_values[template_col_start_idx]:.2f}-{template_lambda_values[template_col_end_idx]:.2f} nm] is invalid after clamping for templates.")
-        return [], [], 0, are_templates_pre_normalized
+        return [], [], 0, are_templates_pre_normalized, None, [], None
 
     num_template_cols_to_crop = template_col_end_idx - template_col_start_idx + 1
     if num_template_cols_to_crop <= 0:
         print(f"Warning: No template columns fall within the target wavelength range [{target_min_wave:.2f}-{target_max_wave:.2f} nm].")
-        return [], [], 0, are_templates_pre_normalized
+        return [], [], 0, are_templates_pre_normalized, None, [], None
     
     #print(f"Scanning directory: {template_dir}")
     
-    sorted_filenames = sorted(os.listdir(template_dir)) # Ensure consistent order for first template check
-
-    for filename in sorted_filenames:
-        if fringe_pattern.match(filename):
-            file_path = os.path.join(template_dir, filename)
-            try:
-                # Assuming load_fits_image_and_header now just returns data for templates
-                image_data, _ = load_fits_image_and_header(file_path) # We don't need header for individual templates here
-                
-                if image_data is None or not isinstance(image_data, np.ndarray) or image_data.ndim != 2:
-                    #print(f"Skipping {filename}: Not a 2D numpy array or empty data")
-                    skipped_files += 1
-                    continue
-                
-                # Check normalization of the first valid template loaded
-                if not first_template_checked_for_norm:
-                    if image_data.size > 0: # Ensure there's data to check
-                        if not is_image_normalized(image_data):
-                            print(f"Warning: The first loaded template fringe ('{filename}') appears to be not normalized (not in [0,1] range). All templates from this set will be used as-is without on-the-fly normalization.")
-                            are_templates_pre_normalized = False
-                        # else: # First template is normalized, no message needed, flag remains True
-                        first_template_checked_for_norm = True
-                    # If image_data.size is 0, we can't check norm, so we wait for the next valid template
-                
-                # Crop the template according to the wavelength range
-                if image_data.shape[1] < num_template_cols_to_crop : # check if template has enough columns
-                     #print(f"Skipping {filename}: Template has fewer columns ({image_data.shape[1]}) than determined by Lambda.fits indices ({num_template_cols_to_crop}). Potentially inconsistent Lambda.fits or template.")
-                     # This check is tricky if Lambda.fits is universal but templates vary in width.
-                     # The critical part is that template_col_start_idx and template_col_end_idx are valid for image_data
-                     if template_col_end_idx >= image_data.shape[1]:
-                         #print(f"Skipping {filename}: template_col_end_idx {template_col_end_idx} out of bounds for template shape {image_data.shape[1]}")
-                         skipped_files += 1
-                         continue
-                
-                cropped_template = image_data[:, template_col_start_idx : template_col_end_idx + 1]
-
-                if cropped_template.shape[1] == 0:
-                    #print(f"Skipping {filename}: Resulted in 0 columns after wavelength cropping.")
-                    skipped_files += 1
-                    continue
-                
-                templates_data.append(cropped_template)
-                template_paths.append(file_path)
-                
-            except Exception as e:
-                #print(f"Error loading or cropping template {file_path}: {e}")
+    # Only the columns of the wavelength range are read off disk
+    template_cols = slice(template_col_start_idx, template_col_end_idx + 1)
+
+    # The FITS reads are I/O bound and release the GIL: overlap them in threads, map keeps the sorted order
+    with ThreadPoolExecutor(max_workers=io_threads(min(32, (os.cpu_count() or 1) + 4))) as executor:
+        loaded_templates = list(executor.map(functools.partial(_load_template, cols=template_cols),
+                                              _iter_template_files(template_dir, template_cols)))
+
+    for filename, file_path, image_data in loaded_templates:
+        try:
+            if image_data is None or not isinstance(image_data, np.ndarray) or image_data.ndim != 2:
+                #print(f"Skipping {filename}: Not a 2D numpy array or empty data")
                 skipped_files += 1
-    
+                continue
+            
+            # Check normalization of the first valid template loaded (its wavelength range)
+            if not first_template_checked_for_norm:
+                if image_data.size > 0: # Ensure there's data to check
+                    if not is_image_normalized(image_data):
+                        print(f"Warning: The first loaded template fringe ('{filename}') appears to be not normalized (not in [0,1] range). All templates from this set will be used as-is without on-the-fly normalization.")
+                        are_templates_pre_normalized = False
+                    # else: # First template is normalized, no message needed, flag remains True
+                    first_template_checked_for_norm = True
+                # If image_data.size is 0, we can't check norm, so we wait for the next valid template
+            
+            # The template was read cropped to the wavelength range, fewer columns mean
+            # that it is narrower than the range (template_col_end_idx out of bounds)
+            if image_data.shape[1] < num_template_cols_to_crop : # check if template has enough columns
+                 #print(f"Skipping {filename}: Template has fewer columns ({image_data.shape[1]}) than determined by Lambda.fits indices ({num_template_cols_to_crop}). Potentially inconsistent Lambda.fits or template.")
+                 skipped_files += 1
+                 continue
+            
+            cropped_template = image_data
+            
+            templates_data.append(cropped_template)
+            template_paths.append(file_path)
+            
+        except Exception as e:
+            #print(f"Error loading or cropping template {file_path}: {e}")
+            skipped_files += 1
+
     #print(f"Found {len(templates_data)} valid Fringe templates after wavelength cropping, skipped {skipped_files} files")
     
-    return templates_data, template_paths, skipped_files, are_templates_pre_normalized
-
-def load_differential_piston_value(best_template_path):
+    # Template statistics for the correlations, computed once instead of per target
+    template_matrix = coarse_matrix = None
+    if templates_data and all(template.shape == templates_data[0].shape for template in templates_data):
+        template_matrix = _normalized_rows(templates_data)
+        coarse_matrix = _normalized_rows([template[::_COARSE_STEP, ::_COARSE_STEP] for template in templates_data])
+    
+    # Differential piston values read once, aligned to the templates
+    template_pistons = load_differential_piston_values(template_dir, template_paths)
+    
+    return templates_data, template_paths, skipped_files, are_templates_pre_normalized, template_matrix, template_pistons, coarse_matrix
+
+# Templates loaded by load_all_templates_cached, per (template_dir, min wave, max wave)
+_template_cache = {}
+
+def _template_signature(template_dir):
+    """Modification times identifying the current content of a template directory.
+    Lambda.fits is rewritten on every create_fringes.py run, so it changes with the templates
+    (the directory itself is not used: writing the cache changes its modification time)."""
+    signature = []
+    for path in (os.path.join(template_dir, "Lambda.fits"), os.path.join(template_dir, "Fringes.fits")):
+        try:
+            stat = os.stat(path)
+            signature.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            signature.append(None)
+    return signature
+
+def load_all_templates_cached(template_dir, target_min_wave, target_max_wave, template_lambda_values, cache_dir=None):
+    """Same as load_all_templates, with the result cached in memory, so that repeated
+    targets (e.g. from analyze_batch.py) do not reload and re-crop the template library.
+    If cache_dir is given, the result is also cached on disk across runs: a
+    cache_<hash>_<min>_<max>.npy stack of the cropped templates in cache_dir (hash identifies
+    template_dir), with a .json sidecar of the template paths; it is rebuilt when the templates change.
+    The template matrices and the differential piston values are recomputed when it is loaded.
     """
-    Load the differential piston value from 'Differential_piston.fits'
-    using the ID from the best_template_path as an index.
+    min_wave, max_wave = round(float(target_min_wave), 3), round(float(target_max_wave), 3)
+    key = (template_dir, min_wave, max_wave)
+    signature = _template_signature(template_dir)
+
+    cached = _template_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    if cache_dir is None:
+        result = load_all_templates(template_dir, target_min_wave, target_max_wave, template_lambda_values)
+        _template_cache[key] = (signature, result)
+        return result
+
+    dir_hash = hashlib.md5(os.path.abspath(template_dir).encode()).hexdigest()[:12]
+    cache_base = os.path.join(cache_dir, f"cache_{dir_hash}_{min_wave}_{max_wave}")
+    result = None
+    try:
+        with open(cache_base + ".json") as f:
+            info = json.load(f)
+        if info["signature"] == signature:
+            # Memory-mapped stack of the cropped templates
+            templates = list(np.load(cache_base + ".npy", mmap_mode='r'))
+            result = (templates, info["template_paths"], info["skipped"], info["are_templates_pre_normalized"],
+                      _normalized_rows(templates) if templates else None,
+                      load_differential_piston_values(template_dir, info["template_paths"]),
+                      _normalized_rows([template[::_COARSE_STEP, ::_COARSE_STEP] for template in templates]) if templates else None)
+    except (OSError, ValueError, KeyError):
+        pass # No valid disk cache
+
+    if result is None:
+        result = load_all_templates(template_dir, target_min_wave, target_max_wave, template_lambda_values)
+        templates = result[0]
+        # Only a library of equally shaped templates (with a template matrix) can be stored as one stack
+        if result[4] is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Written under temporary names and renamed, other processes never see partial files
+                temp_suffix = f".{os.getpid()}.tmp"
+                with open(cache_base + ".npy" + temp_suffix, 'wb') as f:
+                    np.save(f, np.stack(templates))
+                with open(cache_base + ".json" + temp_suffix, 'w') as f:
+                    json.dump({"signature": signature, "template_paths": result[1], "skipped": result[2],
+                               "are_templates_pre_normalized": result[3]}, f)
+                os.replace(cache_base + ".npy" + temp_suffix, cache_base + ".npy")
+                os.replace(cache_base + ".json" + temp_suffix, cache_base + ".json")
+            except OSError as e:
+                print(f"Warning: Could not save the template cache in {cache_dir}: {e}")
+
+    _template_cache[key] = (signature, result)
+    return result
+
+def load_differential_piston_values(template_dir, template_paths):
     """
+    Load 'Differential_piston.fits' from template_dir once and return the differential piston value
+    of every template in template_paths (None where unavailable), using the ID of its file name as an index.
+    """
+    template_pistons = [None] * len(template_paths)
+    piston_file_path = os.path.join(template_dir, "Differential_piston.fits")
+
+    if not template_paths or not os.path.exists(piston_file_path):
+        #print(f"Info: Differential_piston.fits not found at {piston_file_path}")
+        return template_pistons
+
     try:
-        template_dir_of_match = os.path.dirname(best_template_path)
-        piston_file_path = os.path.join(template_dir_of_match, "Differential_piston.fits")
+        piston_array, _ = load_fits_image_and_header(piston_file_path)
+    except Exception as e:
+        #print(f"Error loading differential piston values from {piston_file_path}: {e}")
+        return template_pistons
 
-        if not os.path.exists(piston_file_path):
-            #print(f"Info: Differential_piston.fits not found at {piston_file_path}")
-            return None
+    if not isinstance(piston_array, np.ndarray) or piston_array.ndim != 1:
+        #print(f"Warning: Differential_piston.fits data in {piston_file_path} is not a 1D NumPy array.")
+        return template_pistons
 
-        match_id_search = re.search(r"Fringe_(\d+)\.fits", os.path.basename(best_template_path))
+    for k, template_path in enumerate(template_paths):
+        match_id_search = _FRINGE_RE.search(os.path.basename(template_path))
         if not match_id_search:
-            #print(f"Warning: Could not extract ID from template filename: {os.path.basename(best_template_path)}")
-            return None
+            continue
         fringe_id = int(match_id_search.group(1))
+        if fringe_id < len(piston_array): # Otherwise out of bounds for the piston array
+            template_pistons[k] = piston_array[fringe_id]
+    return template_pistons
 
-        with fits.open(piston_file_path) as hdul:
-            piston_array = hdul[0].data
-            
-            if not isinstance(piston_array, np.ndarray) or piston_array.ndim != 1:
-                #print(f"Warning: Differential_piston.fits data in {piston_file_path} is not a 1D NumPy array.")
-                return None
-
-            if fringe_id >= len(piston_array):
-                #print(f"Warning: Fringe ID {fringe_id} is out of bounds for piston array of length {len(piston_array)} in {piston_file_path}")
-                return None
-            return piston_array[fringe_id]
-
-    except ValueError:
-        #print(f"Warning: Could not convert fringe ID to integer from {os.path.basename(best_template_path)}")
-        return None
-    except Exception as e:
-        piston_file_path_for_error = os.path.join(os.path.dirname(best_template_path), "Differential_piston.fits") if 'best_template_path' in locals() else "Differential_piston.fits"
-        #print(f"Error loading differential piston value from {piston_file_path_for_error}: {e}")
-        return None
+# Figure reused by plot_best_match for every target, created on first use
+_match_figure = None
 
 def plot_best_match(target_image, best_template, target_name, template_name, piston_value, output_dir, method_name):
-    """Plot the target image and the best matching template side by side, with piston value, and save to specified dir."""
+    """Plot the target image and the best matching template side by side, with piston value, and save to specified dir.
+    matplotlib is imported only here, and a standalone Figure (no pyplot backend) is created once and reused."""
+    global _match_figure
     
     if target_image is None or best_template is None or target_image.size == 0 or best_template.size == 0:
         #print(f"Skipping plot for {method_name} due to empty target or template.")
         return
 
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
+    if _match_figure is None:
+        from matplotlib.figure import Figure
+        _match_figure = Figure(figsize=(12, 6))
+        _match_figure.subplots(1, 2)
+    fig = _match_figure
+    ax1, ax2 = fig.axes
+    ax1.clear()
+    ax2.clear()
     
     ax1.imshow(normalize_image(target_image), cmap='viridis')
     ax1.set_title(f"Target: {target_name} (Wavelength Cropped)")
@@ -290,19 +542,17 @@ def plot_best_match(target_image, best_template, target_name, template_name, pis
     ax2.set_title(title_str)
     ax2.axis('off')
     
-    plt.tight_layout()
+    fig.tight_layout()
     
     base_target_name = os.path.splitext(os.path.basename(target_name))[0]
     output_filename = f"{base_target_name}_{method_name}_match.png"
     save_path = os.path.join(output_dir, output_filename)
     
     try:
-        plt.savefig(save_path)
+        fig.savefig(save_path)
         #print(f"Plot saved to {save_path}")
     except Exception as e:
         print(f"Error saving plot {save_path}: {e}")
-    #plt.show() # User has commented this out
-    plt.close(fig) 
 
 def main(args_in=None):
     # If args_in is None, it means the script is run directly.
@@ -310,11 +560,17 @@ def main(args_in=None):
     if args_in is None:
         parser = argparse.ArgumentParser(description="Match a target FITS fringe pattern against a template library, with wavelength cropping.")
         parser.add_argument("target_fits_path", help="Path to the target Qm FITS file.")
+        parser.add_argument("--engine", choices=['numpy', 'numba'], default='numpy', help="Cross-correlation implementation (default: numpy).")
+        parser.add_argument("--cache_dir", default=None, help="Directory where the cropped template library is cached across runs (default: no disk cache). Use a local directory, not the shared template drive.")
+        parser.add_argument("--top_k", type=int, default=None, help="Coarse-to-fine matching: score only the top_k templates of a downsampled first pass at full resolution (default: all templates).")
         args = parser.parse_args()
     else:
         args = args_in # Use the arguments passed from analyze_batch.py
 
     target_file = args.target_fits_path
+    engine = getattr(args, 'engine', 'numpy') # Not set by analyze_batch.py
+    top_k = getattr(args, 'top_k', None)
+    cache_dir = getattr(args, 'cache_dir', None)
     template_dir = r"G:\Shared drives\PNRR-OAA\STILES\WP5000\Integration\SPL\Specula\Fringes\20250509" # Hardcoded for now
 
     try:
@@ -348,19 +604,11 @@ def main(args_in=None):
         print(f"Error: Invalid value for wavelength keyword in target header of {target_file}: {e}")
         return
 
-    # Determine actual wavelengths for each column of the target image
-    # Assuming NAXIS2 columns linearly span MINCOMWV to MAXCOMWV
-    target_actual_wavelengths_per_column = np.linspace(target_min_wave, target_max_wave, naxis2_target)
-    
-    # Determine column indices for cropping the target image to MINCOMWV-MAXCOMWV range
-    # (This might seem redundant if linspace is already over MINCOMWV-MAXCOMWV, but it's good for consistency
-    # if the actual range covered by NAXIS2 was wider and MINCOMWV/MAXCOMWV defined a sub-region)
-    target_crop_start_col = np.searchsorted(target_actual_wavelengths_per_column, target_min_wave, side='left')
-    target_crop_end_col = np.searchsorted(target_actual_wavelengths_per_column, target_max_wave, side='right') - 1
-    
-    # Ensure indices are valid
-    target_crop_start_col = max(0, target_crop_start_col)
-    target_crop_end_col = min(naxis2_target - 1, target_crop_end_col)
+    # Column range of the target image covering MINCOMWV to MAXCOMWV.
+    # NAXIS2 columns are assumed to linearly span MINCOMWV to MAXCOMWV, so the range is all of them
+    # (no wavelength grid and search needed as long as the target is not resampled, see NCOMWAVE)
+    target_crop_start_col = 0
+    target_crop_end_col = naxis2_target - 1
 
     if target_crop_start_col > target_crop_end_col:
         print(f"Error: Target image wavelength range [{target_min_wave}-{target_max_wave}] results in invalid column indices after processing.")
@@ -380,15 +628,15 @@ def main(args_in=None):
         print("Could not load template lambda values. Exiting.")
         return
 
-    # Load and crop template images, also get normalization status of template set
-    templates, template_paths, skipped, are_templates_pre_normalized = load_all_templates(template_dir, target_min_wave, target_max_wave, template_lambda_values)
+    # Load and crop template images (cached across targets), also get normalization status of template set
+    templates, template_paths, skipped, are_templates_pre_normalized, template_matrix, template_pistons, coarse_matrix = load_all_templates_cached(template_dir, target_min_wave, target_max_wave, template_lambda_values, cache_dir)
     #print(f"Loaded {len(templates)} wavelength-cropped template images, skipped {skipped}. Templates pre-normalized: {are_templates_pre_normalized}")
     
     if not templates:
         print("No valid template images found after wavelength cropping.")
         return
     
-    #methods = ['cross_correlation', 'template_matching']
+    #methods = ['cross_correlation', 'template_matching', 'opencv_ncc']
     methods =['cross_correlation']
     output_plot_dir = os.path.dirname(target_file)
     
@@ -396,11 +644,12 @@ def main(args_in=None):
     final_piston_value = None # Variable to store the piston value for return
 
     for method in methods:
-        best_idx, scores = match_fringe_pattern(target_image_wavelength_cropped, templates, are_templates_pre_normalized, method=method)
+        best_idx, scores = match_fringe_pattern(target_image_wavelength_cropped, templates, are_templates_pre_normalized, method=method, engine=engine, template_matrix=template_matrix,
+                                                top_k=top_k, coarse_matrix=coarse_matrix)
         
         if best_idx != -1 and scores: # Check for valid match
             best_template_file_path = template_paths[best_idx]
-            piston_value = load_differential_piston_value(best_template_file_path)
+            piston_value = template_pistons[best_idx]
             
             # If this is the cross_correlation method, store its piston_value
             if method == 'cross_correlation':
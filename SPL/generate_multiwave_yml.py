@@ -1,23 +1,26 @@
 import argparse
+import io
 import numpy as np
 
-def generateMultiwaveYml(initial_wavelength, final_wavelength, wavelength_step, output_file):
+def multiwaveYmlContent(initial_wavelength, final_wavelength, wavelength_step):
     """
-    Generates a YAML configuration file for PSF calculations with a range of wavelengths.
+    Builds the YAML configuration for PSF calculations with a range of wavelengths, in memory.
 
     Parameters:
     initial_wavelength (int): The starting wavelength (in nm).
     final_wavelength (int): The final wavelength (in nm).
     wavelength_step (int): The step size for wavelength increments (in nm).
-    output_file (str): The file path where the YAML content will be saved.
+
+    Returns:
+    str: The YAML content.
     """
     system_Fn = 100.8  # System F-number
     pixel_size = 4.5  # Pixel size in microns
     wavelengths = list(range(initial_wavelength, final_wavelength + 1, wavelength_step))  # Convert to list
     nd_array = np.array(wavelengths) * system_Fn / 1000 / pixel_size  # Calculate the ND array
 
-    # Open file for writing
-    with open(output_file, "w") as f:
+    # Build the content in memory
+    with io.StringIO() as f:
         f.write("---\n\n")
 
         # Main section
@@ -67,31 +70,46 @@ dm:
   outputs:  ['out_layer']
 """)
 
-        # PSF instances for each wavelength
-        f.write("\n")
-        for idx, wl in enumerate(wavelengths):
-            f.write(f"psf{wl}:\n")
-            f.write(f"  class: 'PSF'\n")
-            f.write(f"  wavelengthInNm: {wl}\n")
-            f.write(f"  nd: {nd_array[idx]:.6f}\n")  
-            f.write(f"  start_time: 0.\n")
-            f.write(f"  roi_pixels: 150\n")
-            f.write(f"  inputs:\n")
-            f.write(f"      in_ef: 'prop.out_on_axis_source_ef'\n")
-            f.write(f"  outputs: ['out_psf']\n")
-            f.write("\n")
+        # PSF instances for each wavelength, formatted in memory and written at once
+        psf_blocks = [f"psf{wl}:\n"
+                      f"  class: 'PSF'\n"
+                      f"  wavelengthInNm: {wl}\n"
+                      f"  nd: {nd:.6f}\n"
+                      f"  start_time: 0.\n"
+                      f"  roi_pixels: 150\n"
+                      f"  inputs:\n"
+                      f"      in_ef: 'prop.out_on_axis_source_ef'\n"
+                      f"  outputs: ['out_psf']\n\n"
+                      for wl, nd in zip(wavelengths, nd_array)]
+        f.write("\n" + "".join(psf_blocks))
 
         # Data store section
-        f.write("\ndata_store:\n")
-        f.write("  class: 'DataStore'\n")
-        #f.write("  store_dir: 'G:/Shared drives/PNRR-OAA/STILES/WP5000/Integration/SPL/Specula'\n")  
-        f.write("  store_dir: 'D:/Data/SPL_Data'\n")
-        f.write("  inputs:\n")
-        f.write("    input_list: [\n")
-        for wl in wavelengths:
-            f.write(f"      'psf{wl}-psf{wl}.out_psf',\n")  
-        #f.write("      'res_ef-prop.out_on_axis_source_ef'\n")
-        f.write("    ]\n")
+        input_list = "".join(f"      'psf{wl}-psf{wl}.out_psf',\n" for wl in wavelengths)
+        # Alternatives: store_dir 'G:/Shared drives/PNRR-OAA/STILES/WP5000/Integration/SPL/Specula',
+        # input_list entry 'res_ef-prop.out_on_axis_source_ef'
+        f.write("\ndata_store:\n"
+                "  class: 'DataStore'\n"
+                "  store_dir: 'D:/Data/SPL_Data'\n"
+                "  inputs:\n"
+                "    input_list: [\n"
+                f"{input_list}"
+                "    ]\n")
+
+        return f.getvalue()
+
+def generateMultiwaveYml(initial_wavelength, final_wavelength, wavelength_step, output_file):
+    """
+    Generates a YAML configuration file for PSF calculations with a range of wavelengths.
+
+    Parameters:
+    initial_wavelength (int): The starting wavelength (in nm).
+    final_wavelength (int): The final wavelength (in nm).
+    wavelength_step (int): The step size for wavelength increments (in nm).
+    output_file (str): The file path where the YAML content will be saved.
+    """
+    content = multiwaveYmlContent(initial_wavelength, final_wavelength, wavelength_step)
+    with open(output_file, "w") as f:
+        f.write(content)
 
     print(f"YAML file '{output_file}' generated successfully!")
 
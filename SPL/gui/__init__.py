@@ -3,5 +3,14 @@ SPL GUI Application
 A graphical user interface for the SPL calibration workflow.
 """
 
+import sys
+from pathlib import Path
+
 __version__ = "1.0.0"
 
+# The tabs import the SPL scripts (create_fringes, create_spl_mask, ...) from the SPL directory:
+# added once here for all of them, at the end of the path and only if it is missing
+_SPL_DIR = str(Path(__file__).resolve().parents[1])
+if _SPL_DIR not in sys.path:
+    sys.path.append(_SPL_DIR)
+
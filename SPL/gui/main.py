@@ -15,6 +15,7 @@ from gui.tabs.ifunc_tab import IFuncTab
 from gui.tabs.params_tab import ParamsTab
 from gui.tabs.simulation_tab import SimulationTab
 from gui.tabs.fringes_tab import FringesTab
+from gui.utils import start_task_loop
 
 
 class SPLGUI:
@@ -25,6 +26,9 @@ class SPLGUI:
         self.root.title("SPL Calibration Workflow")
         self.root.geometry("900x700")
         
+        # Background event loop running the long tasks of the tabs
+        start_task_loop()
+        
         # Create notebook (tabbed interface)
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -4,19 +4,20 @@ Tab for creating fringe patterns from PSF files.
 
 import tkinter as tk
 from tkinter import messagebox
-import sys
 import os
 import threading
-
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import contextlib
+import asyncio
+import functools
 
 from gui.utils import (
     create_labeled_entry, 
     create_labeled_entry_with_browse,
     browse_folder,
     validate_float,
-    validate_int
+    validate_int,
+    async_task,
+    bind_scrollregion
 )
 
 
@@ -32,10 +33,7 @@ class FringesTab:
         scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=canvas.yview)
         scrollable_frame = tk.Frame(canvas)
         
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        bind_scrollregion(canvas, scrollable_frame)
         
         canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
         canvas.configure(yscrollcommand=scrollbar.set)
@@ -148,6 +146,17 @@ class FringesTab:
         )
         row += 1
         
+        # Output layout: all the fringes go into the single Fringes.fits cube,
+        # the per-piston files are only written on request
+        self.split_files_var = tk.BooleanVar()
+        split_files_check = tk.Checkbutton(
+            input_frame,
+            text="Also save one file per piston (Fringe_XXXXX.fits)",
+            variable=self.split_files_var
+        )
+        split_files_check.grid(row=row, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        row += 1
+        
         # Button frame
         button_frame = tk.Frame(scrollable_frame)
         button_frame.pack(pady=20)
@@ -167,6 +176,26 @@ class FringesTab:
         # Status label
         self.status_label = tk.Label(scrollable_frame, text="", fg="blue")
         self.status_label.pack(pady=10)
+        
+        # Import create_fringes in the background, so that the first click does not wait for it
+        self._imports_ready = threading.Event()
+        self._import_error = None
+        threading.Thread(target=self._warm_imports, daemon=True).start()
+    
+    def _warm_imports(self):
+        """Import create_fringes (numpy, astropy, fitsio) once, off the GUI thread."""
+        try:
+            from create_fringes import process_all_piston_values
+            self._process_all_piston_values = process_all_piston_values
+            try:
+                import fitsio  # Optional: faster CFITSIO-based read of the piston file
+            except ImportError:
+                fitsio = None
+            self._fitsio = fitsio
+        except Exception as e:
+            self._import_error = e # Reported by the next click
+        finally:
+            self._imports_ready.set()
     
     def set_status_callback(self, callback):
         """Set the status callback function."""
@@ -228,48 +257,59 @@ class FringesTab:
             messagebox.showerror("Error", f"Piston file not found: {piston_file}")
             return
         
-        # Disable button during execution
-        self.create_button.config(state=tk.DISABLED)
+        split_files = self.split_files_var.get()
+        
         self.update_status("Creating fringe patterns...")
         
-        # Run in separate thread
+        # Blocking part, run in the executor of the task loop
         def run_create_fringes():
-            try:
-                from create_fringes import process_all_piston_values
-                import numpy as np
-                from astropy.io import fits
-                
+            self._imports_ready.wait() # Imported by _warm_imports
+            if self._import_error is not None:
+                raise self._import_error
+            fitsio = self._fitsio
+
+            with contextlib.ExitStack() as open_files:
                 # Read piston values from file if provided
                 piston_values = None
                 if piston_file:
-                    with fits.open(piston_file) as hdul:
+                    if fitsio is not None:
+                        piston_values = fitsio.read(piston_file, ext=0)
+                    else:
+                        from astropy.io import fits
+                        # Memory-mapped, passed on without a copy: the file must stay
+                        # open until process_all_piston_values returns
+                        hdul = open_files.enter_context(fits.open(piston_file, memmap=True))
                         piston_values = hdul[0].data
                 
-                process_all_piston_values(
+                self._process_all_piston_values(
                     parent_folder=parent_folder,
                     output_folder=output_folder,
                     num_rows_to_accumulate=num_rows,
                     piston_min=piston_min,
                     piston_max=piston_max,
                     piston_step=piston_step,
-                    piston_values=piston_values
+                    piston_values=piston_values,
+                    split_files=split_files
                 )
-                
-                self.frame.after(0, lambda: self.update_status(
+        
+        # Button disabled while the task runs on the task loop, the returned updates are applied when it ends
+        @async_task(self.create_button)
+        async def create_fringes_task():
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, run_create_fringes)
+                return [functools.partial(
+                    self.update_status,
                     f"Fringe patterns created successfully in: {output_folder}"
-                ))
-                self.frame.after(0, lambda: messagebox.showinfo(
+                ), functools.partial(
+                    messagebox.showinfo,
                     "Success", 
                     f"Fringe patterns created successfully!\n\n"
                     f"Output folder: {output_folder}"
-                ))
+                )]
             except Exception as e:
                 error_msg = f"Error creating fringes: {str(e)}"
-                self.frame.after(0, lambda: self.update_status(error_msg))
-                self.frame.after(0, lambda: messagebox.showerror("Error", error_msg))
-            finally:
-                self.frame.after(0, lambda: self.create_button.config(state=tk.NORMAL))
+                return [functools.partial(self.update_status, error_msg),
+                        functools.partial(messagebox.showerror, "Error", error_msg)]
         
-        thread = threading.Thread(target=run_create_fringes, daemon=True)
-        thread.start()
+        create_fringes_task()
 
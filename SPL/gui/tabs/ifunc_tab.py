@@ -4,14 +4,12 @@ Tab for creating DM influence function.
 
 import tkinter as tk
 from tkinter import messagebox
-import sys
 import os
 import threading
+import asyncio
+import functools
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
-from gui.utils import create_labeled_entry, validate_int
+from gui.utils import create_labeled_entry, validate_int, async_task
 
 
 class IFuncTab:
@@ -69,6 +67,23 @@ class IFuncTab:
         # Status label
         self.status_label = tk.Label(self.frame, text="", fg="blue")
         self.status_label.pack(pady=10)
+        
+        # Import create_dm_ifunc in the background, so that the first click does not wait for it
+        self._imports_ready = threading.Event()
+        self._import_error = None
+        threading.Thread(target=self._warm_imports, daemon=True).start()
+    
+    def _warm_imports(self):
+        """Import create_dm_ifunc (numpy, astropy, matplotlib) once, off the GUI thread."""
+        try:
+            import matplotlib
+            matplotlib.use('Agg')  # Use non-interactive backend
+            from create_dm_ifunc import createDmInfluenceFunction
+            self._createDmInfluenceFunction = createDmInfluenceFunction
+        except Exception as e:
+            self._import_error = e # Reported by the next click
+        finally:
+            self._imports_ready.set()
     
     def set_status_callback(self, callback):
         """Set the status callback function."""
@@ -97,42 +112,42 @@ class IFuncTab:
         if not filename.endswith('.fits'):
             filename += '.fits'
         
-        # Disable button during execution
-        self.create_button.config(state=tk.DISABLED)
         self.update_status("Creating influence function...")
         
-        # Run in separate thread to avoid blocking UI
+        # Blocking part, run in the executor of the task loop
         def run_create_ifunc():
+            self._imports_ready.wait() # Imported by _warm_imports
+            if self._import_error is not None:
+                raise self._import_error
+            
+            step_response = self._createDmInfluenceFunction(size=pixel_pupil, filename=filename)
+            
+            # Save step response (files already written for this size are reused)
+            saved_file_path = step_response.save_step_response(skip_existing=True)
+            
+            # Save mask piston
+            mask_piston_file_path = step_response.save_mask_piston(skip_existing=True)
+            return saved_file_path, mask_piston_file_path
+        
+        # Button disabled while the task runs on the task loop, the returned updates are applied when it ends
+        @async_task(self.create_button)
+        async def create_ifunc_task():
             try:
-                import matplotlib
-                matplotlib.use('Agg')  # Use non-interactive backend
-                
-                from create_dm_ifunc import createDmInfluenceFunction
-                
-                step_response = createDmInfluenceFunction(size=pixel_pupil, filename=filename)
-                
-                # Save step response
-                saved_file_path = step_response.save_step_response()
-                
-                # Save mask piston
-                mask_piston_file_path = step_response.save_mask_piston()
-                
-                self.frame.after(0, lambda: self.update_status(
+                saved_file_path, mask_piston_file_path = await asyncio.get_running_loop().run_in_executor(None, run_create_ifunc)
+                return [functools.partial(
+                    self.update_status,
                     f"IF function created successfully!"
-                ))
-                self.frame.after(0, lambda: messagebox.showinfo(
+                ), functools.partial(
+                    messagebox.showinfo,
                     "Success", 
                     f"Influence function created successfully!\n\n"
                     f"Step response: {saved_file_path}\n"
                     f"Mask piston: {mask_piston_file_path}"
-                ))
+                )]
             except Exception as e:
                 error_msg = f"Error creating IF function: {str(e)}"
-                self.frame.after(0, lambda: self.update_status(error_msg))
-                self.frame.after(0, lambda: messagebox.showerror("Error", error_msg))
-            finally:
-                self.frame.after(0, lambda: self.create_button.config(state=tk.NORMAL))
+                return [functools.partial(self.update_status, error_msg),
+                        functools.partial(messagebox.showerror, "Error", error_msg)]
         
-        thread = threading.Thread(target=run_create_ifunc, daemon=True)
-        thread.start()
+        create_ifunc_task()
 
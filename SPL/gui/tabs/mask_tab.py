@@ -4,14 +4,12 @@ Tab for creating SPL mask.
 
 import tkinter as tk
 from tkinter import messagebox
-import sys
 import os
 import threading
+import asyncio
+import functools
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
-from gui.utils import create_labeled_entry, validate_int, validate_float
+from gui.utils import create_labeled_entry, validate_int, validate_float, async_task
 
 
 class MaskTab:
@@ -76,6 +74,21 @@ class MaskTab:
         # Status label
         self.status_label = tk.Label(self.frame, text="", fg="blue")
         self.status_label.pack(pady=10)
+        
+        # Import create_spl_mask in the background, so that the first click does not wait for it
+        self._imports_ready = threading.Event()
+        self._import_error = None
+        threading.Thread(target=self._warm_imports, daemon=True).start()
+    
+    def _warm_imports(self):
+        """Import create_spl_mask (numpy, astropy, numba) once, off the GUI thread."""
+        try:
+            from create_spl_mask import createSplMask
+            self._createSplMask = createSplMask
+        except Exception as e:
+            self._import_error = e # Reported by the next click
+        finally:
+            self._imports_ready.set()
     
     def set_status_callback(self, callback):
         """Set the status callback function."""
@@ -110,45 +123,44 @@ class MaskTab:
             messagebox.showerror("Error", "Filename cannot be empty")
             return
         
-        # Disable button during execution
-        self.create_button.config(state=tk.DISABLED)
         self.update_status("Creating mask...")
         
-        # Run in separate thread to avoid blocking UI
+        # Ensure filename doesn't have .fits extension (script adds it)
+        if filename.endswith('.fits'):
+            clean_filename = filename[:-5]
+        else:
+            clean_filename = filename
+        
+        # Blocking part, run in the executor of the task loop
         def run_create_mask():
+            self._imports_ready.wait() # Imported by _warm_imports
+            if self._import_error is not None:
+                raise self._import_error
+            
+            self._createSplMask(
+                pixel_pupil=pixel_pupil,
+                gap=gap,
+                clock_angle=clock_angle,
+                filename=clean_filename
+            )
+        
+        # Button disabled while the task runs on the task loop, the returned updates are applied when it ends
+        @async_task(self.create_button)
+        async def create_mask_task():
             try:
-                import matplotlib
-                matplotlib.use('Agg')  # Use non-interactive backend
-                
-                from create_spl_mask import createSplMask
-                
-                # Ensure filename doesn't have .fits extension (script adds it)
-                if filename.endswith('.fits'):
-                    clean_filename = filename[:-5]
-                else:
-                    clean_filename = filename
-                
-                createSplMask(
-                    pixel_pupil=pixel_pupil,
-                    gap=gap,
-                    clock_angle=clock_angle,
-                    filename=clean_filename
-                )
-                
-                self.frame.after(0, lambda: self.update_status(
+                await asyncio.get_running_loop().run_in_executor(None, run_create_mask)
+                return [functools.partial(
+                    self.update_status,
                     f"Mask created successfully: {clean_filename}.fits"
-                ))
-                self.frame.after(0, lambda: messagebox.showinfo(
+                ), functools.partial(
+                    messagebox.showinfo,
                     "Success", 
                     f"Mask created successfully!\nSaved as: {clean_filename}.fits\nLocation: .\\calib\\data\\"
-                ))
+                )]
             except Exception as e:
                 error_msg = f"Error creating mask: {str(e)}"
-                self.frame.after(0, lambda: self.update_status(error_msg))
-                self.frame.after(0, lambda: messagebox.showerror("Error", error_msg))
-            finally:
-                self.frame.after(0, lambda: self.create_button.config(state=tk.NORMAL))
+                return [functools.partial(self.update_status, error_msg),
+                        functools.partial(messagebox.showerror, "Error", error_msg)]
         
-        thread = threading.Thread(target=run_create_mask, daemon=True)
-        thread.start()
+        create_mask_task()
 
@@ -4,14 +4,16 @@ Tab for setting piston scan parameters and generating YAML file.
 
 import tkinter as tk
 from tkinter import messagebox
-import sys
 import os
 import threading
+import queue
+import yaml
+try:
+    from yaml import CSafeLoader as Loader, CSafeDumper as Dumper  # libyaml C extension
+except ImportError:
+    from yaml import SafeLoader as Loader, SafeDumper as Dumper
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
-from gui.utils import create_labeled_entry, validate_int, validate_float
+from gui.utils import create_labeled_entry, validate_int, validate_float, bind_scrollregion
 
 
 class ParamsTab:
@@ -20,16 +22,14 @@ class ParamsTab:
     def __init__(self, parent):
         self.frame = tk.Frame(parent)
         self.status_callback = None
+        self._ui_q = queue.Queue() # (function, args) UI updates from the worker thread, (None, ()) at the end
         
         # Create scrollable frame
         canvas = tk.Canvas(self.frame)
         scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=canvas.yview)
         scrollable_frame = tk.Frame(canvas)
         
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        bind_scrollregion(canvas, scrollable_frame)
         
         canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
         canvas.configure(yscrollcommand=scrollbar.set)
@@ -193,6 +193,18 @@ class ParamsTab:
             self.status_callback(message)
         self.status_label.config(text=message)
     
+    def _pump(self):
+        """Apply the UI updates queued by the worker thread, every 10 ms until its end."""
+        for _ in range(100): # At most 100 updates per call, the rest at the next one
+            try:
+                fn, args = self._ui_q.get_nowait()
+            except queue.Empty:
+                break
+            if fn is None:
+                return # Worker finished
+            fn(*args)
+        self.frame.after(10, self._pump)
+    
     def generate_yml(self):
         """Generate the YAML file using generate_multiwave_yml.py."""
         # Validate inputs
@@ -222,87 +234,51 @@ class ParamsTab:
         
         # Run in separate thread
         def run_generate_yml():
+            updates = []
             try:
-                from generate_multiwave_yml import generateMultiwaveYml
-                import yaml
-                import re
-                
-                # Generate basic YAML
-                generateMultiwaveYml(initial_wl, final_wl, wl_step, output_file)
+                from generate_multiwave_yml import multiwaveYmlContent
                 
-                # Read the generated YAML file
-                with open(output_file, 'r') as f:
-                    yaml_content = f.read()
+                # Generate basic YAML in memory, the file is written once with the parameters set
+                data = yaml.load(multiwaveYmlContent(initial_wl, final_wl, wl_step), Loader=Loader)
                 
-                # Replace parameters using regex (since the file is written as text)
-                yaml_content = re.sub(
-                    r"pixel_pupil:\s*\d+",
-                    f"pixel_pupil:       {int(self.pixel_pupil_entry.get())}",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"pixel_pitch:\s*[\d.e-]+",
-                    f"pixel_pitch:       {self.pixel_pitch_entry.get()}",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"total_time:\s*[\d.]+",
-                    f"total_time:        {float(self.total_time_entry.get())}",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"time_step:\s*[\d.]+",
-                    f"time_step:         {float(self.time_step_entry.get())}",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"input_mask_data:\s*'[^']+'",
-                    f"input_mask_data: '{self.mask_data_entry.get().strip()}'",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"slope:\s*\[[\d.]+\]",
-                    f"slope: [{float(self.ramp_slope_entry.get())}]",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"constant:\s*\[[\d-]+\]",
-                    f"constant: [{float(self.ramp_constant_entry.get())}]",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"ifunc_data:\s*'[^']+'",
-                    f"ifunc_data: '{self.ifunc_data_entry.get().strip()}'",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"mask_data:\s*'[^']+'",
-                    f"mask_data: '{self.mask_piston_entry.get().strip()}'",
-                    yaml_content
-                )
-                yaml_content = re.sub(
-                    r"store_dir:\s*'[^']+'",
-                    f"store_dir: '{self.store_dir_entry.get().strip()}'",
-                    yaml_content
-                )
+                # Set the parameters in the parsed file: (section, key, conversion, entry)
+                params = [
+                    ('main', 'pixel_pupil', int, self.pixel_pupil_entry),
+                    ('main', 'pixel_pitch', float, self.pixel_pitch_entry),
+                    ('main', 'total_time', float, self.total_time_entry),
+                    ('main', 'time_step', float, self.time_step_entry),
+                    ('pupilstop', 'input_mask_data', str.strip, self.mask_data_entry),
+                    ('ramp', 'slope', lambda v: [float(v)], self.ramp_slope_entry),
+                    ('ramp', 'constant', lambda v: [float(v)], self.ramp_constant_entry),
+                    ('ifunc', 'ifunc_data', str.strip, self.ifunc_data_entry),
+                    ('ifunc', 'mask_data', str.strip, self.mask_piston_entry),
+                    ('data_store', 'store_dir', str.strip, self.store_dir_entry),
+                ]
+                for section, key, convert, entry in params:
+                    data[section][key] = convert(entry.get())
                 
                 # Write back
                 with open(output_file, 'w') as f:
-                    f.write(yaml_content)
+                    yaml.dump(data, f, Dumper=Dumper, sort_keys=False, default_flow_style=False, explicit_start=True)
                 
-                self.frame.after(0, lambda: self.update_status(
-                    f"YAML file generated successfully: {output_file}"
-                ))
-                self.frame.after(0, lambda: messagebox.showinfo(
-                    "Success", 
-                    f"YAML file generated successfully!\n\nSaved as: {output_file}"
-                ))
+                updates = [(self.update_status, (f"YAML file generated successfully: {output_file}",)),
+                           (messagebox.showinfo, (
+                               "Success", 
+                               f"YAML file generated successfully!\n\nSaved as: {output_file}"
+                           ))]
             except Exception as e:
                 error_msg = f"Error generating YAML file: {str(e)}"
-                self.frame.after(0, lambda: self.update_status(error_msg))
-                self.frame.after(0, lambda: messagebox.showerror("Error", error_msg))
+                updates = [(self.update_status, (error_msg,)),
+                           (messagebox.showerror, ("Error", error_msg))]
             finally:
-                self.frame.after(0, lambda: self.generate_button.config(state=tk.NORMAL))
+                # Button first, the dialog waits to be closed
+                self._ui_q.put((self.generate_button.config, ({'state': tk.NORMAL},)))
+                for update in updates:
+                    self._ui_q.put(update)
+                self._ui_q.put((None, ())) # Last call of _pump
+        
+        # Updates applied by _pump
+        self.frame.after(10, self._pump)
         
         thread = threading.Thread(target=run_generate_yml, daemon=True)
         thread.start()
@@ -8,9 +8,10 @@ import sys
 import os
 import threading
 import subprocess
-
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import queue
+import io
+import codecs
+import locale
 
 from gui.utils import create_labeled_entry_with_browse, browse_file
 
@@ -22,6 +23,8 @@ class SimulationTab:
         self.frame = tk.Frame(parent)
         self.status_callback = None
         self.process = None
+        self._output_queue = queue.Queue() # Output chunks of the simulation
+        self._ui_q = queue.Queue() # (function, args) UI updates from the worker thread, (None, ()) at the end
         
         # Title
         title = tk.Label(self.frame, text="Run PSF Simulation", 
@@ -120,6 +123,27 @@ class SimulationTab:
             self.status_callback(message)
         self.status_label.config(text=message)
     
+    def _pump(self):
+        """Show the output and apply the UI updates queued by the worker thread, every 10 ms until its end."""
+        pending = []
+        while True:
+            try:
+                pending.append(self._output_queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending:
+            self.output_text.insert(tk.END, ''.join(pending))
+            self.output_text.see(tk.END)
+        for _ in range(100): # At most 100 updates per call, the rest at the next one
+            try:
+                fn, args = self._ui_q.get_nowait()
+            except queue.Empty:
+                break
+            if fn is None:
+                return # Worker finished
+            fn(*args)
+        self.frame.after(10, self._pump)
+    
     def browse_yml_file(self):
         """Browse for YAML file."""
         file_path = browse_file(
@@ -146,49 +170,65 @@ class SimulationTab:
         self.output_text.delete(1.0, tk.END)
         self.update_status("Running simulation...")
         
+        # Output and updates shown by _pump, rather than with one callback per line
+        self.frame.after(10, self._pump)
+        
         # Run in separate thread
         def run_sim():
+            updates = []
             try:
-                # Build command
-                cmd = [sys.executable, "main_simul.py", yml_file]
+                # Build command (the YAML file path made absolute, the simulation runs in the SPL directory)
+                cmd = [sys.executable, "main_simul.py", os.path.abspath(yml_file)]
                 if self.use_cpu_var.get():
                     cmd.append("--cpu")
                 
-                # Change to SPL directory
+                # Run in the SPL directory, without changing the working directory of the GUI
                 spl_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                os.chdir(spl_dir)
                 
                 self.process = subprocess.Popen(
                     cmd,
+                    cwd=spl_dir,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
+                    bufsize=0
                 )
                 
-                # Read output line by line
-                for line in iter(self.process.stdout.readline, ''):
-                    if line:
-                        self.frame.after(0, lambda l=line: self.output_text.insert(tk.END, l))
-                        self.frame.after(0, lambda: self.output_text.see(tk.END))
+                # Read the output in chunks as it arrives, decoded as in text mode
+                # (split characters and \r\n line ends are handled across chunks)
+                decoder = io.IncrementalNewlineDecoder(
+                    codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace'),
+                    translate=True
+                )
+                fd = self.process.stdout.fileno()
+                while True:
+                    data = os.read(fd, 65536)
+                    text = decoder.decode(data, final=not data)
+                    if text:
+                        self._output_queue.put(text)
+                    if not data:
+                        break
                 
                 self.process.wait()
                 
-                if self.process.returncode == 0:
-                    self.frame.after(0, lambda: self.update_status("Simulation completed successfully!"))
-                    self.frame.after(0, lambda: messagebox.showinfo("Success", "Simulation completed successfully!"))
+                returncode = self.process.returncode
+                if returncode == 0:
+                    updates = [(self.update_status, ("Simulation completed successfully!",)),
+                               (messagebox.showinfo, ("Success", "Simulation completed successfully!"))]
                 else:
-                    self.frame.after(0, lambda: self.update_status(f"Simulation ended with code {self.process.returncode}"))
-                    self.frame.after(0, lambda: messagebox.showwarning("Warning", f"Simulation ended with code {self.process.returncode}"))
+                    updates = [(self.update_status, (f"Simulation ended with code {returncode}",)),
+                               (messagebox.showwarning, ("Warning", f"Simulation ended with code {returncode}"))]
             except Exception as e:
                 error_msg = f"Error running simulation: {str(e)}"
-                self.frame.after(0, lambda: self.update_status(error_msg))
-                self.frame.after(0, lambda: messagebox.showerror("Error", error_msg))
+                updates = [(self.update_status, (error_msg,)),
+                           (messagebox.showerror, ("Error", error_msg))]
             finally:
-                self.frame.after(0, lambda: self.run_button.config(state=tk.NORMAL))
-                self.frame.after(0, lambda: self.stop_button.config(state=tk.DISABLED))
                 self.process = None
+                # Buttons first, the dialogs wait to be closed
+                self._ui_q.put((self.run_button.config, ({'state': tk.NORMAL},)))
+                self._ui_q.put((self.stop_button.config, ({'state': tk.DISABLED},)))
+                for update in updates:
+                    self._ui_q.put(update)
+                self._ui_q.put((None, ())) # Last call of _pump
         
         thread = threading.Thread(target=run_sim, daemon=True)
         thread.start()
@@ -5,6 +5,82 @@ Utility functions for the SPL GUI.
 import tkinter as tk
 from tkinter import filedialog
 import os
+import asyncio
+import functools
+import threading
+import re
+
+
+# Accepted formats of validate_int and validate_float (checked before converting, instead of catching ValueError)
+_INT_RE = re.compile(r'[+-]?\d+')
+_FLOAT_RE = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+
+
+# Event loop running the long tasks of the tabs, in a single background thread
+_task_loop = None
+_task_loop_lock = threading.Lock()
+
+
+def start_task_loop():
+    """Start the asyncio event loop of the GUI tasks (once) and return it."""
+    global _task_loop
+    with _task_loop_lock:
+        if _task_loop is None:
+            _task_loop = asyncio.new_event_loop()
+            threading.Thread(target=_task_loop.run_forever, daemon=True).start()
+    return _task_loop
+
+
+def post_ui(widget, *updates):
+    """Run the widget updates (callables without arguments) in a single Tk idle callback."""
+    def run_updates():
+        for update in updates:
+            update()
+    widget.after_idle(run_updates)
+
+
+def async_task(button):
+    """
+    Decorator running a coroutine function on the task loop instead of the Tk thread.
+    The button is disabled when the task is started. The coroutine runs blocking code
+    with loop.run_in_executor and returns the widget updates to apply once it ends:
+    they are posted after the button re-enable, as one Tk callback.
+    """
+    def decorator(coroutine_function):
+        @functools.wraps(coroutine_function)
+        def start(*args, **kwargs):
+            button.config(state=tk.DISABLED)
+            future = asyncio.run_coroutine_threadsafe(coroutine_function(*args, **kwargs), start_task_loop())
+
+            def finish(future):
+                failed = future.cancelled() or future.exception() is not None
+                updates = () if failed else (future.result() or ())
+                post_ui(button, functools.partial(button.config, state=tk.NORMAL), *updates)
+            future.add_done_callback(finish)
+            return future
+        return start
+    return decorator
+
+
+def bind_scrollregion(canvas, frame, delay=50):
+    """
+    Keep the scroll region of the canvas fitted to its content when frame is resized.
+    The region is recomputed once, delay ms after the last of a burst of <Configure> events.
+    """
+    pending = None
+
+    def update():
+        nonlocal pending
+        pending = None
+        canvas.configure(scrollregion=canvas.bbox("all"))
+
+    def schedule(event):
+        nonlocal pending
+        if pending is not None:
+            canvas.after_cancel(pending)
+        pending = canvas.after(delay, update)
+
+    frame.bind("<Configure>", schedule)
 
 
 def browse_folder(initial_dir=None):
@@ -27,28 +103,26 @@ def browse_file(initial_dir=None, filetypes=None):
 
 def validate_float(value, min_val=None, max_val=None):
     """Validate a float value."""
-    try:
-        float_val = float(value)
-        if min_val is not None and float_val < min_val:
-            return False, f"Value must be >= {min_val}"
-        if max_val is not None and float_val > max_val:
-            return False, f"Value must be <= {max_val}"
-        return True, float_val
-    except ValueError:
+    if _FLOAT_RE.fullmatch(value.strip()) is None:
         return False, "Invalid number"
+    float_val = float(value)
+    if min_val is not None and float_val < min_val:
+        return False, f"Value must be >= {min_val}"
+    if max_val is not None and float_val > max_val:
+        return False, f"Value must be <= {max_val}"
+    return True, float_val
 
 
 def validate_int(value, min_val=None, max_val=None):
     """Validate an integer value."""
-    try:
-        int_val = int(value)
-        if min_val is not None and int_val < min_val:
-            return False, f"Value must be >= {min_val}"
-        if max_val is not None and int_val > max_val:
-            return False, f"Value must be <= {max_val}"
-        return True, int_val
-    except ValueError:
+    if _INT_RE.fullmatch(value.strip()) is None:
         return False, "Invalid integer"
+    int_val = int(value)
+    if min_val is not None and int_val < min_val:
+        return False, f"Value must be >= {min_val}"
+    if max_val is not None and int_val > max_val:
+        return False, f"Value must be <= {max_val}"
+    return True, int_val
 
 
 def create_labeled_entry(parent, label_text, row, default_value="", width=20):
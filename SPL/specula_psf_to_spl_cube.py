@@ -1,11 +1,149 @@
 import os
-import glob
+import re
+import argparse
 from pathlib import Path
 import numpy as np
 from astropy.io import fits
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fits_io import io_threads
 
-def process_psf_files(base_path):
+try:
+    import fitsio  # Optional: faster CFITSIO-based reads and writes
+except ImportError:
+    fitsio = None
+
+# Wavelength of a PSF file, from its name (psfXXX.fits)
+_PSF_RE = re.compile(r'psf(\d+)\.fits$')
+# Wavelength of a cropped PSF file of the previous layout, from its name (psfXXX_crop.fits)
+_PSF_CROP_RE = re.compile(r'psf(\d+)_crop\.fits$')
+# Cropped PSFs of a timestamp folder: one image extension per wavelength (WAVELEN keyword)
+_CROPS_FILE = "crops.fits"
+
+def _crop_psf_file(psf_file):
+    """
+    Crop the central 100x100 pixels of every plane of a PSF cube.
+    Only the central rows are read (with CFITSIO, or through the astropy section interface).
+
+    Returns:
+    --------
+    numpy.ndarray
+        Cropped cube
+    """
+    if fitsio is not None:
+        # CFITSIO reads the requested rows straight from disk
+        with fitsio.FITS(psf_file) as f:
+            hdu = f[0]
+            center_y, center_x = (size // 2 for size in hdu.get_dims()[1:])
+            return hdu[:, center_y - 50:center_y + 50, center_x - 50:center_x + 50]
+
+    # Open the fits file without loading the data cube (section reads bypass the memory map)
+    with fits.open(psf_file, memmap=False) as hdul:
+        hdu = hdul[0]
+        
+        # Get the center coordinates from the header
+        center_y = hdu.shape[1] // 2
+        center_x = hdu.shape[2] // 2
+        
+        # Calculate crop boundaries (100x100 pixels)
+        y_start = center_y - 50
+        y_end = center_y + 50
+        x_start = center_x - 50
+        x_end = center_x + 50
+        
+        # Read only the crop of every plane from the file
+        return hdu.section[:, y_start:y_end, x_start:x_end]
+
+def _write_crops(filename, crops):
+    """
+    Save the (wavelength, cropped cube) pairs in a single file: an empty primary HDU,
+    then one image extension PSFXXX per wavelength with its WAVELEN keyword.
+    """
+    if fitsio is not None:
+        with fitsio.FITS(filename, 'rw', clobber=True) as f:
+            f.write(None)
+            for wavelength, data in crops:
+                f.write(data, extname=f"PSF{wavelength}",
+                        header=[{'name': 'WAVELEN', 'value': wavelength, 'comment': 'Wavelength [nm]'}])
+        return
+    hdul = fits.HDUList([fits.PrimaryHDU()])
+    for wavelength, data in crops:
+        hdu = fits.ImageHDU(data, name=f"PSF{wavelength}")
+        hdu.header['WAVELEN'] = (wavelength, 'Wavelength [nm]')
+        hdul.append(hdu)
+    # Freshly built arrays: no header verification needed
+    hdul.writeto(filename, overwrite=True, output_verify='ignore', checksum=False)
+
+def _read_crops_wavelengths(filename):
+    """
+    List the (wavelength, extension) pairs of a crops.fits file, reading only the headers.
+    """
+    if fitsio is not None:
+        with fitsio.FITS(filename) as f:
+            headers = [hdu.read_header() for hdu in f]
+    else:
+        with fits.open(filename) as hdul:
+            headers = [hdu.header for hdu in hdul]
+    return [(int(header['WAVELEN']), ext) for ext, header in enumerate(headers) if 'WAVELEN' in header]
+
+def _crop_psf_folder(folder, psf_files):
+    """
+    Crop the PSF files of a timestamp folder and save them together in the folder's crops.fits,
+    one image extension per wavelength. Worker of process_psf_files.
+
+    Returns:
+    --------
+    list of str
+        Error messages, empty on success
+    """
+    errors = []
+    crops = []
+    for psf_file in psf_files:
+        try:
+            match = _PSF_RE.search(os.path.basename(psf_file))
+            if match is None:
+                raise ValueError("no wavelength in the file name (psfXXX.fits)")
+            crops.append((int(match.group(1)), _crop_psf_file(psf_file)))
+        except Exception as e:
+            errors.append(f"Error processing {psf_file}: {str(e)}")
+    
+    # Save all the crops with a single file
+    if crops:
+        _write_crops(os.path.join(folder, _CROPS_FILE), crops)
+    return errors
+
+def _list_folders(base_path):
+    """
+    List the (non hidden) folders of base_path, as glob("*") would.
+    """
+    with os.scandir(base_path) as entries:
+        return [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+
+def _scan_psf_folder(folder):
+    """
+    List the PSF files of a timestamp folder with a single directory scan.
+
+    Returns:
+    --------
+    tuple
+        (psf_files, crop_files, crops_file): the psf*.fits and psf*_crop.fits paths,
+        and the path of crops.fits (None if missing)
+    """
+    psf_files, crop_files, crops_file = [], [], None
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            name = os.path.normcase(entry.name)  # normcase: case-insensitive on Windows, as glob
+            if not entry.is_file():
+                continue
+            if name == _CROPS_FILE:
+                crops_file = entry.path
+            elif name.startswith("psf") and name.endswith("_crop.fits"):
+                crop_files.append(entry.path)
+            elif name.startswith("psf") and name.endswith(".fits"):
+                psf_files.append(entry.path)
+    return psf_files, crop_files, crops_file
+
+def process_psf_files(base_path, max_workers=None):
     """
     Process PSF fits files from multiple timestamp folders.
     
@@ -13,148 +151,169 @@ def process_psf_files(base_path):
     -----------
     base_path : str
         Base path containing the timestamp folders
+    max_workers : int, optional
+        Number of worker processes cropping the folders. If None, uses the number of CPUs
     """
     # Get all timestamp folders
-    timestamp_folders = glob.glob(os.path.join(base_path, "*"))
+    timestamp_folders = _list_folders(base_path)
     
-    # First, count total number of PSF files to process
-    total_psf_files = 0
+    # First, list the PSF files to process in every folder
+    folders = []
+    psf_files = []
     for folder in timestamp_folders:
-        if os.path.isdir(folder):
-            # Check if folder already has cropped files
-            if not glob.glob(os.path.join(folder, "psf*_crop.fits")):
-                psf_files = glob.glob(os.path.join(folder, "psf*.fits"))
-                total_psf_files += len([f for f in psf_files if "_crop.fits" not in f])
-    
-    print(f"\nTotal PSF files to process: {total_psf_files}")
-    
-    # Create progress bar for total files
-    with tqdm(total=total_psf_files, desc="Processing PSF files") as pbar:
-        for folder in timestamp_folders:
-            if not os.path.isdir(folder):
-                continue
-                
-            # Skip folders that already have cropped files
-            if glob.glob(os.path.join(folder, "psf*_crop.fits")):
-                print(f"\nSkipping folder {os.path.basename(folder)} - already processed")
-                continue
-                
-            print(f"\nProcessing folder: {os.path.basename(folder)}")
+        folder_files, crop_files, crops_file = _scan_psf_folder(folder)
             
-            # Find all PSF fits files in the current folder
-            psf_files = glob.glob(os.path.join(folder, "psf*.fits"))
+        # Skip folders that already have cropped files
+        if crops_file is not None or crop_files:
+            print(f"\nSkipping folder {os.path.basename(folder)} - already processed")
+            continue
             
-            for psf_file in psf_files:
-                # Skip already processed files
-                if "_crop.fits" in psf_file:
-                    continue
-                    
-                try:
-                    # Read the fits file
-                    with fits.open(psf_file) as hdul:
-                        # Get the data cube
-                        data = hdul[0].data
-                        
-                        # Get the center coordinates
-                        center_y = data.shape[1] // 2
-                        center_x = data.shape[2] // 2
-                        
-                        # Calculate crop boundaries (100x100 pixels)
-                        y_start = center_y - 50
-                        y_end = center_y + 50
-                        x_start = center_x - 50
-                        x_end = center_x + 50
-                        
-                        # Crop the data
-                        cropped_data = data[:, y_start:y_end, x_start:x_end]
-                        
-                        # Create output filename
-                        output_file = psf_file.replace(".fits", "_crop.fits")
-                        
-                        # Save the cropped data
-                        hdu = fits.PrimaryHDU(cropped_data)
-                        hdu.writeto(output_file, overwrite=True)
-                        
-                except Exception as e:
-                    print(f"Error processing {psf_file}: {str(e)}")
-                
-                # Update progress bar
-                pbar.update(1)
-
-def reorganize_cubes(base_path):
+        # PSF fits files of the current folder, in name order
+        folder_files.sort()
+        if not folder_files:
+            continue
+        
+        print(f"\nFound folder to process: {os.path.basename(folder)}")
+        folders.append(folder)
+        psf_files.append(folder_files)
+    
+    print(f"\nTotal PSF files to process: {sum(len(files) for files in psf_files)}")
+    if not folders:
+        return
+    
+    # Crop the folders in parallel, the workers only receive the file paths
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Create progress bar for total folders
+        for errors in tqdm(executor.map(_crop_psf_folder, folders, psf_files),
+                           total=len(folders), desc="Processing PSF folders"):
+            for error in errors:
+                print(error)
+
+def _write_all_pistons(filename, all_data, wavelengths):
+    """
+    Save the (piston, wavelength, y, x) array as a single 4-D cube (NAXIS4 = number of pistons),
+    with the wavelength of every plane in a WAVELENGTHS binary table extension.
+    """
+    cards = [('WAVMIN', min(wavelengths), "Minimum wavelength (nm)"),
+             ('WAVMAX', max(wavelengths), "Maximum wavelength (nm)"),
+             ('WAVSTP', wavelengths[1] - wavelengths[0] if len(wavelengths) > 1 else 0, "Wavelength step (nm)")]
+    wavelength_table = np.array(wavelengths, dtype=[('WAVELEN', 'i4')])
+    if fitsio is not None:
+        with fitsio.FITS(filename, 'rw', clobber=True) as f:
+            f.write(all_data, header=[{'name': keyword, 'value': value, 'comment': comment}
+                                      for keyword, value, comment in cards])
+            f.write(wavelength_table, extname='WAVELENGTHS')
+        return
+    fits.HDUList([fits.PrimaryHDU(all_data, header=fits.Header(cards)),
+                  fits.BinTableHDU(wavelength_table, name='WAVELENGTHS')]).writeto(
+        filename, overwrite=True, output_verify='ignore', checksum=False)
+
+def reorganize_cubes(base_path, split_files=False, float32=True):
     """
     Reorganize the cropped PSF cubes by differential piston values.
+    All the cubes are saved in specula_cubes/all_pistons.fits, a single (piston, wavelength, y, x) cube.
     
     Parameters:
     -----------
     base_path : str
         Base path containing the timestamp folders
+    split_files : bool, optional
+        Also save the cube of every piston value as its own image_XXXX.fits file
+    float32 : bool, optional
+        Store and save floating point PSFs as float32 (default); False keeps their original precision
     """
     # Create output directory for reorganized cubes
     output_dir = os.path.join(base_path, "specula_cubes")
     os.makedirs(output_dir, exist_ok=True)
     
     # Get all timestamp folders
-    timestamp_folders = glob.glob(os.path.join(base_path, "*"))
+    timestamp_folders = _list_folders(base_path)
     
-    # Find all cropped PSF files across all folders
-    all_cropped_files = []
+    # Find all cropped PSFs across all folders, as (wavelength, file, extension):
+    # the extensions of crops.fits, or the psfXXX_crop.fits files of the previous layout
+    cropped_psfs = []
     for folder in timestamp_folders:
-        if os.path.isdir(folder) and "specula_cubes" not in folder:
-            cropped_files = glob.glob(os.path.join(folder, "psf*_crop.fits"))
-            all_cropped_files.extend(cropped_files)
+        if "specula_cubes" not in folder:
+            _, crop_files, crops_file = _scan_psf_folder(folder)
+            if crops_file is not None:
+                cropped_psfs.extend((wavelength, crops_file, ext) for wavelength, ext in _read_crops_wavelengths(crops_file))
+            else:
+                cropped_psfs.extend((int(_PSF_CROP_RE.search(os.path.basename(file)).group(1)), file, 0)
+                                    for file in crop_files)
     
-    if not all_cropped_files:
+    if not cropped_psfs:
         print("No cropped files found!")
         return
+    
+    # Extensions to read from every file
+    file_extensions = {}
+    for wavelength, file, ext in cropped_psfs:
+        file_extensions.setdefault(file, []).append((wavelength, ext))
         
-    print(f"\nFound {len(all_cropped_files)} cropped files across all folders")
-    
-    # Read first file to get dimensions
-    with fits.open(all_cropped_files[0]) as hdul:
-        first_data = hdul[0].data
-        n_pistons = first_data.shape[0]
-        cube_size = first_data.shape[1:]
-    
-    # Create arrays to store wavelength information
-    wavelengths = []
-    for file in all_cropped_files:
-        # Extract wavelength from filename (assuming format psfXXX_crop.fits)
-        wavelength = int(os.path.basename(file).split('psf')[1].split('_')[0])
-        wavelengths.append(wavelength)
-    
-    wavelengths = sorted(list(set(wavelengths)))  # Remove duplicates and sort
+    print(f"\nFound {len(cropped_psfs)} cropped PSFs in {len(file_extensions)} files across all folders")
+    
+    # Read first PSF to get dimensions
+    _, first_file, first_ext = cropped_psfs[0]
+    if fitsio is not None:
+        first_data = fitsio.read(first_file, ext=first_ext)
+    else:
+        first_data = fits.getdata(first_file, ext=first_ext)
+    n_pistons = first_data.shape[0]
+    cube_size = first_data.shape[1:]
+    
+    wavelengths = sorted({wavelength for wavelength, _, _ in cropped_psfs})  # Remove duplicates and sort
     n_wavelengths = len(wavelengths)
     
     print(f"Found {n_wavelengths} unique wavelengths: {wavelengths}")
-    print(f"Reading {len(all_cropped_files)} files...")
+    print(f"Reading {len(file_extensions)} files...")
     
-    # Pre-load all data into memory
-    all_data = {}
-    for file in tqdm(all_cropped_files, desc="Loading files"):
-        wavelength = int(os.path.basename(file).split('psf')[1].split('_')[0])
+    # Pre-load all data into memory, directly into one (piston, wavelength, y, x) array:
+    # the cube of each piston is then a contiguous view, written without any copy.
+    # Floating point PSFs are stored (and saved) as float32 unless disabled: half the bytes of float64, ample precision
+    wavelength_index = {wavelength: w_idx for w_idx, wavelength in enumerate(wavelengths)}
+    dtype = np.float32 if float32 and np.issubdtype(first_data.dtype, np.floating) else first_data.dtype
+    all_data = np.empty((n_pistons, n_wavelengths, *cube_size), dtype=dtype)
+    
+    def load(file):
+        # Every file fills its own wavelength planes of all_data
+        if fitsio is not None:
+            with fitsio.FITS(file) as f:
+                for wavelength, ext in file_extensions[file]:
+                    all_data[:, wavelength_index[wavelength]] = f[ext].read()[:n_pistons]
+            return
         with fits.open(file) as hdul:
-            all_data[wavelength] = hdul[0].data
+            for wavelength, ext in file_extensions[file]:
+                all_data[:, wavelength_index[wavelength]] = hdul[ext].data[:n_pistons]
+    
+    # Read the files in threads, to overlap the disk reads
+    # (a single one if fitsio links a CFITSIO build that is not thread safe)
+    with ThreadPoolExecutor(max_workers=io_threads(min(16, len(file_extensions)))) as executor:
+        for _ in tqdm(executor.map(load, file_extensions), total=len(file_extensions), desc="Loading files"):
+            pass
     
     print("Creating and saving cubes...")
-    # Process each differential piston value
-    for piston_idx in tqdm(range(n_pistons), desc="Creating cubes"):
-        # Create a cube for this piston value
-        piston_cube = np.zeros((n_wavelengths, *cube_size), dtype=first_data.dtype)
-        
-        # Fill the cube with data from each wavelength
-        for w_idx, wavelength in enumerate(wavelengths):
-            piston_cube[w_idx] = all_data[wavelength][piston_idx]
-        
-        # Save the reorganized cube
-        output_file = os.path.join(output_dir, f"image_{piston_idx:04d}.fits")
-        hdu = fits.PrimaryHDU(piston_cube)
-        hdu.writeto(output_file, overwrite=True)
+    # Save all the cubes with a single contiguous write
+    _write_all_pistons(os.path.join(output_dir, "all_pistons.fits"), all_data, wavelengths)
+    
+    if split_files:
+        # Process each differential piston value
+        for piston_idx in tqdm(range(n_pistons), desc="Creating cubes"):
+            # Save the reorganized cube of this piston value
+            output_file = os.path.join(output_dir, f"image_{piston_idx:04d}.fits")
+            if fitsio is not None:
+                fitsio.write(output_file, all_data[piston_idx], clobber=True)
+            else:
+                fits.writeto(output_file, all_data[piston_idx], overwrite=True, output_verify='ignore', checksum=False)
     
     # Clear memory
     del all_data
 
 def main():
+    parser = argparse.ArgumentParser(description="Crop the SPECULA PSF cubes and reorganize them by differential piston value.")
+    parser.add_argument("--split_files", action="store_true", help="Also save every piston as its own specula_cubes/image_XXXX.fits file (the layout used before all_pistons.fits).")
+    parser.add_argument("--float64", action="store_true", help="Keep the original precision of the PSFs instead of saving them as float32.")
+    args = parser.parse_args()
+
     # Base path containing the timestamp folders
     base_path = r"G:\Shared drives\PNRR-OAA\STILES\WP5000\Integration\SPL\Specula\20250408"
     
@@ -162,7 +321,7 @@ def main():
     process_psf_files(base_path)
     
     # Then reorganize the cropped cubes
-    reorganize_cubes(base_path)
+    reorganize_cubes(base_path, split_files=args.split_files, float32=not args.float64)
 
 if __name__ == "__main__":
     main()